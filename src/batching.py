@@ -0,0 +1,117 @@
+import os
+import asyncio
+import logging
+from concurrency import run_blocking
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Default batching window and batch size for model inference
+batch_max_size = int(os.getenv('BATCH_MAX_SIZE', '16'))
+batch_max_wait_ms = float(os.getenv('BATCH_MAX_WAIT_MS', '5'))
+
+
+#Collects concurrent single-item requests for a model and runs them as one batched call
+#batch_function takes a list of inputs and returns a list of outputs in the same order
+class MicroBatcher:
+    def __init__(self, name, batch_function, max_batch_size=None, max_wait_ms=None):
+        self.name = name
+        self.batch_function = batch_function
+        self.max_batch_size = max_batch_size or batch_max_size
+        self.max_wait = (batch_max_wait_ms if max_wait_ms is None else max_wait_ms) / 1000
+        self._pending = []
+        self._timer = None
+        #Running batches; the loop only keeps weak references to tasks, so they are held here until done
+        self._tasks = set()
+        self.batches = 0
+        self.items = 0
+        self.retried_items = 0
+
+    #Queue one input and wait for its result; the batch runs when full or when the window closes
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    #Run the pending inputs now and wait for every running batch, e.g. on shutdown
+    async def close(self):
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    #Run one forward pass on the inference pool and route each result back to its caller
+    async def _run(self, batch):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            outputs = await self._call(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                logger.error(f"{self.name} call failed: {e}")
+                self._resolve(batch[0][1], exception=e)
+                return
+            #One bad input must not fail everyone batched with it, so retry the items one by one
+            logger.warning(f"Batched {self.name} call failed for {len(batch)} items, retrying them one by one: {e}")
+            self.retried_items += len(batch)
+            await asyncio.gather(*(self._run_alone(entry) for entry in batch))
+            return
+        for (_, future), output in zip(batch, outputs):
+            self._resolve(future, output)
+
+    async def _run_alone(self, entry):
+        try:
+            output, = await self._call([entry])
+        except Exception as e:
+            logger.error(f"{self.name} call failed for one item: {e}")
+            self._resolve(entry[1], exception=e)
+            return
+        self._resolve(entry[1], output)
+
+    async def _call(self, batch):
+        outputs = await run_blocking(self.batch_function, [item for item, _ in batch])
+        if len(outputs) != len(batch):
+            raise RuntimeError(f"{self.name} returned {len(outputs)} results for a batch of {len(batch)}")
+        return outputs
+
+    #The caller may have given up (e.g. a stage timeout cancelled its future)
+    @staticmethod
+    def _resolve(future, output=None, exception=None):
+        if future.done():
+            return
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(output)
+
+    #Average number of items per forward pass so far
+    def mean_batch_size(self):
+        return self.items / self.batches if self.batches else 0.0
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'running_batches': len(self._tasks),
+            'batches': self.batches,
+            'items': self.items,
+            'retried_items': self.retried_items,
+            'mean_batch_size': round(self.mean_batch_size(), 3),
+        }
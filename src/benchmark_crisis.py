@@ -0,0 +1,50 @@
+import time
+import argparse
+from crisis_processing import analyzer, detect_crisis, match_crisis_keywords
+from resources import critical_keywords, dangerous_keywords
+
+#Microbenchmark of the compiled crisis keyword matcher against the previous per-keyword scan
+#Usage: python benchmark_crisis.py --repeat 2000
+#The expected keyword matches are checked by tests/test_crisis_processing.py
+
+sample_messages = [
+    "I'm feeling anxious today, can you help?",
+    "Work has been really stressful and I can't sleep properly.",
+    "I had an argument with my partner and I feel like nobody cares about me.",
+    "Honestly I just want to give up on everything, I can't do this anymore.",
+    "Can you suggest some breathing exercises for a panic attack?",
+    "Today was actually a pretty good day, I went for a walk in the park.",
+]
+
+
+#The matcher used before: one lowercase copy and substring scan per keyword, and sentiment always scored
+def previous_detect_crisis(message):
+    contains_critical_keyword = any(keyword in message.lower() for keyword in critical_keywords)
+    contains_dangerous_keyword = any(keyword in message.lower() for keyword in dangerous_keywords)
+    sentiment_score = analyzer.polarity_scores(message)['compound']
+    if contains_critical_keyword:
+        return True
+    return contains_dangerous_keyword and sentiment_score <= -0.65
+
+
+def time_function(function, messages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            function(message)
+    return (time.perf_counter() - start) / (repeat * len(messages)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark crisis keyword detection")
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'function':<24}{'us/message':>12}")
+    print(f"{'previous detect_crisis':<24}{time_function(previous_detect_crisis, sample_messages, args.repeat):>12.1f}")
+    print(f"{'detect_crisis':<24}{time_function(detect_crisis, sample_messages, args.repeat):>12.1f}")
+    print(f"{'match_crisis_keywords':<24}{time_function(match_crisis_keywords, sample_messages, args.repeat):>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
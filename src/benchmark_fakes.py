@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Iterator
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from benchmark_retrieval import synthetic_corpus
+
+#Offline stand-ins for the OpenAI chat model, the local models, the Telegram bot and the S3 corpus,
+#used by benchmark_load.py to exercise bot_interactions without any credentials or network access
+
+fake_reply = (
+    "Well, it sounds like today has been a lot to carry. You know, it's completely okay to feel that way. "
+    "Maybe try a short walk or writing down what's on your mind, and see which one feels right for you. "
+    "What do you think has been weighing on you the most?"
+)
+
+
+#Chat model that answers after a fixed latency and then emits tokens at a fixed rate, reporting token usage like OpenAI
+class FakeChatModel(BaseChatModel):
+    latency: float = 0.5
+    tokens_per_second: float = 50.0
+    reply: str = fake_reply
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake-chat'
+
+    def _tokens(self):
+        return [word + " " for word in self.reply.split(" ")]
+
+    def _usage(self, messages):
+        input_tokens = sum(len(str(message.content)) // 4 for message in messages)
+        output_tokens = len(self._tokens())
+        return {'input_tokens': input_tokens, 'output_tokens': output_tokens, 'total_tokens': input_tokens + output_tokens}
+
+    def _result(self, messages):
+        usage = self._usage(messages)
+        message = AIMessage(content=self.reply, usage_metadata=usage)
+        token_usage = {'prompt_tokens': usage['input_tokens'], 'completion_tokens': usage['output_tokens'], 'total_tokens': usage['total_tokens']}
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={'token_usage': token_usage})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency + len(self._tokens()) / self.tokens_per_second)
+        return self._result(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency + len(self._tokens()) / self.tokens_per_second)
+        return self._result(messages)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for token in self._tokens():
+            time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for token in self._tokens():
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages)))
+
+
+#Deterministic text embedding from a hash of the text, with a CPU cost per batch and per item like a small encoder
+class FakeEncoder:
+    def __init__(self, dim=384, batch_seconds=0.005, item_seconds=0.001):
+        self.dim = dim
+        self.batch_seconds = batch_seconds
+        self.item_seconds = item_seconds
+
+    def _embed(self, text):
+        seed = int.from_bytes(hashlib.sha1(text.encode('utf-8')).digest()[:8], 'little')
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+
+    def encode(self, sentences, convert_to_numpy=True, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        time.sleep(self.batch_seconds + self.item_seconds * len(texts))
+        embeddings = np.stack([self._embed(text) for text in texts])
+        return embeddings[0] if single else embeddings
+
+
+#Emotion pipeline returning a score for every label, shaped like the transformers pipeline output with top_k=None
+class FakeEmotionClassifier:
+    labels = ('anger', 'disgust', 'fear', 'joy', 'neutral', 'sadness', 'surprise')
+
+    def __init__(self, batch_seconds=0.005, item_seconds=0.001):
+        self.batch_seconds = batch_seconds
+        self.item_seconds = item_seconds
+
+    def __call__(self, texts, batch_size=None, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        time.sleep(self.batch_seconds + self.item_seconds * len(texts))
+        outputs = []
+        for text in texts:
+            weights = np.random.default_rng(len(text)).random(len(self.labels))
+            weights /= weights.sum()
+            outputs.append([{'label': label, 'score': float(score)} for label, score in zip(self.labels, weights)])
+        return outputs[0] if single else outputs
+
+
+#Telegram bot stand-in with a fixed round-trip latency per API call; counts every call
+class FakeBot:
+    def __init__(self, latency=0.02):
+        self.latency = latency
+        self.calls = {'send_message': 0, 'edit_message_text': 0, 'send_chat_action': 0}
+        self._next_message_id = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls['send_message'] += 1
+        await asyncio.sleep(self.latency)
+        self._next_message_id += 1
+        return SimpleNamespace(message_id=self._next_message_id, chat_id=chat_id, text=text)
+
+    async def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        self.calls['edit_message_text'] += 1
+        await asyncio.sleep(self.latency)
+        return True
+
+    async def send_chat_action(self, chat_id, action, **kwargs):
+        self.calls['send_chat_action'] += 1
+        await asyncio.sleep(self.latency)
+        return True
+
+
+#Just the parts of telegram.Update and the handler context that the handlers use
+def make_update(user_id, text):
+    return SimpleNamespace(
+        message=SimpleNamespace(from_user=SimpleNamespace(id=user_id), text=text),
+        effective_chat=SimpleNamespace(id=user_id),
+    )
+
+
+def make_context(bot):
+    return SimpleNamespace(bot=bot)
+
+
+#Write a synthetic transcript_embeddings.json in the layout of the S3 object, for EMBEDDINGS_SOURCE_DIR
+def write_synthetic_corpus(path, count, dim, seed=0):
+    matrix = synthetic_corpus(count, dim, seed)
+    pairs = [[f"Client message {i} about stress, sleep and work.", f"Counselor reply {i} with a gentle coping suggestion."] for i in range(count)]
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'embeddings': matrix.tolist(), 'pairs': pairs}, f)
+    return path
@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import argparse
+import resource
+import numpy as np
+from inference_backends import (emotion_model_name, inference_backends, load_sentence_encoder, load_text_classifier,
+                                retrieval_model_name)
+from retrieval_index import BruteForceIndex
+
+#Accuracy parity and speed/memory of the optimized inference backends against the fp32 torch models
+#Usage: python benchmark_inference.py --backends quantized,onnx --threads 2 --corpus-samples 500
+
+#Held-out sample of the kind of messages the bot receives; --corpus-samples adds client messages from the corpus
+sample_texts = [
+    "I've been feeling really anxious about work lately",
+    "I can't sleep, my mind keeps racing at night",
+    "Honestly I'm just so tired of everything",
+    "I got the job! I can't believe it",
+    "My partner yelled at me again and I'm furious",
+    "I feel so alone since I moved to this city",
+    "The news today really scared me",
+    "I'm not sure how I feel, just kind of numb",
+    "My best friend surprised me with a visit, it made my week",
+    "I keep thinking I'm going to fail my exams",
+    "It's disgusting how my boss treats people",
+    "I miss my mum so much, it's been a year since she passed",
+    "Things are okay I guess, nothing special",
+    "I was shocked when they told me the results",
+    "Why does nobody ever listen to me",
+    "I had a really calm and peaceful weekend",
+    "I'm worried about my dad's health",
+    "Everything feels pointless lately",
+    "I finally went for a run and it felt great",
+    "I'm so angry at myself for messing this up",
+    "My heart races whenever I have to speak in meetings",
+    "I don't know why I cry so much these days",
+    "We had a lovely dinner with the family",
+    "I can't stop checking my phone for bad news",
+]
+
+
+#Resident memory of this process right now (Linux), falling back to the peak on other systems
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def load_measured(loader):
+    rss = current_rss_mb()
+    start = time.perf_counter()
+    model = loader()
+    return model, time.perf_counter() - start, current_rss_mb() - rss
+
+
+#Milliseconds per input, median over repeated runs, for single inputs and for batches
+def ms_per_item(run, texts, batch_size, repeat):
+    run(texts[:batch_size])
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            run(texts[i:i + batch_size])
+        timings.append((time.perf_counter() - start) / len(texts))
+    return float(np.median(timings)) * 1000
+
+
+def top_labels(outputs):
+    return [max(scores, key=lambda x: x['score'])['label'] for scores in outputs]
+
+
+def emotion_parity(reference_outputs, candidate_outputs):
+    agreement = np.mean([a == b for a, b in zip(top_labels(reference_outputs), top_labels(candidate_outputs))])
+    score_diff = 0.0
+    for reference, candidate in zip(reference_outputs, candidate_outputs):
+        reference_scores = {x['label']: x['score'] for x in reference}
+        score_diff = max([score_diff] + [abs(reference_scores[x['label']] - x['score']) for x in candidate])
+    return f"top label agreement {agreement:.1%}, max score diff {score_diff:.3f}"
+
+
+#Production encodes the corpus once with the reference model and only queries with the candidate,
+#so compare the top-k neighbours each model's query embedding finds in the reference-encoded corpus
+def retrieval_parity(reference_embeddings, candidate_embeddings, corpus, k):
+    a = reference_embeddings / np.linalg.norm(reference_embeddings, axis=1, keepdims=True)
+    b = candidate_embeddings / np.linalg.norm(candidate_embeddings, axis=1, keepdims=True)
+    cosines = (a * b).sum(axis=1)
+    index = BruteForceIndex(corpus)
+    overlap = np.mean([len(set(index.search(ref, k)[0].tolist()) & set(index.search(cand, k)[0].tolist())) / k
+                       for ref, cand in zip(reference_embeddings, candidate_embeddings)])
+    return f"overlap@{k} {overlap:.1%}, cosine to reference mean {cosines.mean():.4f} min {cosines.min():.4f}"
+
+
+def benchmark_emotion(backends, texts, args):
+    print(f"\nemotion classifier ({emotion_model_name}), {len(texts)} texts")
+    print(f"{'backend':<12}{'load s':>8}{'RSS +MB':>10}{'ms/item b=1':>14}{f'ms/item b={args.batch_size}':>16}  parity")
+    reference_outputs = None
+    for backend in backends:
+        try:
+            classifier, load_seconds, rss = load_measured(lambda: load_text_classifier(emotion_model_name, backend, args.threads))
+        except (ValueError, ImportError, OSError) as e:
+            print(f"{backend:<12}skipped: {e}")
+            continue
+        run = lambda batch, classifier=classifier: classifier(batch, batch_size=len(batch), truncation=True)
+        single = ms_per_item(run, texts, 1, args.repeat)
+        batched = ms_per_item(run, texts, args.batch_size, args.repeat)
+        outputs = run(texts)
+        if reference_outputs is None:
+            reference_outputs, parity = outputs, "reference"
+        else:
+            parity = emotion_parity(reference_outputs, outputs)
+        print(f"{backend:<12}{load_seconds:>8.1f}{rss:>10.0f}{single:>14.2f}{batched:>16.2f}  {parity}")
+        #Release this backend's model before loading the next one, so the RSS deltas stay separate
+        classifier = run = None
+
+
+def benchmark_retrieval(backends, texts, corpus, args):
+    print(f"\nretrieval model ({retrieval_model_name}), {len(texts)} texts")
+    print(f"{'backend':<12}{'load s':>8}{'RSS +MB':>10}{'ms/item b=1':>14}{f'ms/item b={args.batch_size}':>16}  parity")
+    reference_embeddings = None
+    for backend in backends:
+        try:
+            encoder, load_seconds, rss = load_measured(lambda: load_sentence_encoder(retrieval_model_name, backend, args.threads))
+        except (ValueError, ImportError, OSError) as e:
+            print(f"{backend:<12}skipped: {e}")
+            continue
+        run = lambda batch, encoder=encoder: encoder.encode(batch, convert_to_numpy=True, batch_size=len(batch))
+        single = ms_per_item(run, texts, 1, args.repeat)
+        batched = ms_per_item(run, texts, args.batch_size, args.repeat)
+        embeddings = np.asarray(run(texts), dtype=np.float32)
+        if reference_embeddings is None:
+            reference_embeddings, parity = embeddings, "reference"
+            #Without the stored corpus, the reference embeddings of the sample stand in for it
+            corpus = reference_embeddings if corpus is None else corpus
+        else:
+            parity = retrieval_parity(reference_embeddings, embeddings, corpus, args.k)
+        print(f"{backend:<12}{load_seconds:>8.1f}{rss:>10.0f}{single:>14.2f}{batched:>16.2f}  {parity}")
+        #Release this backend's model before loading the next one, so the RSS deltas stay separate
+        encoder = run = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare optimized inference backends with the fp32 torch models")
+    parser.add_argument('--backends', default='quantized,onnx', help="Comma-separated backends to compare with torch")
+    parser.add_argument('--models', default='emotion,retrieval', help="Comma-separated models to benchmark")
+    parser.add_argument('--threads', type=int, default=None, help="Intra-op threads per forward pass (default INFERENCE_THREADS)")
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--k', type=int, default=2, help="Neighbours compared for retrieval overlap")
+    parser.add_argument('--corpus-samples', type=int, default=0, help="Add this many client messages from the embedding store to the sample and search the stored corpus")
+    args = parser.parse_args()
+
+    backends = ['torch'] + [backend for backend in args.backends.split(',') if backend and backend != 'torch']
+    for backend in backends:
+        if backend not in inference_backends:
+            parser.error(f"unknown backend '{backend}', expected one of: {', '.join(inference_backends)}")
+
+    texts = list(sample_texts)
+    corpus = None
+    if args.corpus_samples:
+        from download_embeddings import load_embeddings_from_s3
+        store = load_embeddings_from_s3()
+        corpus = store.embeddings
+        rng = np.random.default_rng(0)
+        for i in rng.choice(len(store.pairs), size=min(args.corpus_samples, len(store.pairs)), replace=False):
+            texts.append(store.pairs[int(i)][0].strip())
+
+    models = args.models.split(',')
+    if 'emotion' in models:
+        benchmark_emotion(backends, texts, args)
+    if 'retrieval' in models:
+        benchmark_retrieval(backends, texts, corpus, args)
+
+
+if __name__ == '__main__':
+    main()
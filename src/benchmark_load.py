@@ -0,0 +1,260 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+from types import SimpleNamespace
+import numpy as np
+from benchmark_fakes import (FakeBot, FakeChatModel, FakeEmotionClassifier, FakeEncoder, make_context, make_update,
+                             write_synthetic_corpus)
+
+#Offline load test of the full message pipeline: fake LLM, fake Telegram bot, local models replaced by
+#stand-ins and a synthetic embedding corpus. Many simulated users run scripted conversations concurrently.
+#Usage: python benchmark_load.py --users 200 --turns 5 --corpus 20000 --save-baseline baseline.json
+#       python benchmark_load.py --users 200 --turns 5 --corpus 20000 --compare baseline.json
+
+conversation_script = [
+    "I've been feeling really anxious about work lately",
+    "I can't sleep well, my mind keeps racing at night",
+    "My manager keeps adding deadlines and I feel overwhelmed",
+    "I tried going for a walk but it only helped a little",
+    "Sometimes I just feel lonely even when I'm with friends",
+    "How can I stop overthinking everything?",
+    "Thanks, I think writing things down might help",
+]
+
+#Appended to the script lines so users do not all send identical prompts (which would all hit the retrieval cache)
+prompt_details = ["", " this week", " again today", " since Monday", " more than usual", " at the moment", " lately too"]
+
+#(section, field, higher is better) compared against a saved baseline
+tracked_results = [
+    ('handle_message', 'p50_ms', False),
+    ('handle_message', 'p95_ms', False),
+    ('handle_message', 'p99_ms', False),
+    ('handle_message', 'per_second', True),
+    ('daily_check_in', 'per_second', True),
+    ('retrieval_chain', 'p50_ms', False),
+    ('retrieval_chain', 'p95_ms', False),
+    ('process', 'peak_rss_mb', False),
+]
+
+
+#Point every external dependency at local files; must run before any bot module is imported
+def configure_environment(args, workdir):
+    source_dir = os.path.join(workdir, 'source')
+    os.environ['EMBEDDINGS_SOURCE_DIR'] = source_dir
+    os.environ['EMBEDDINGS_CACHE_DIR'] = os.path.join(workdir, 'cache')
+    os.environ['MEMORY_DB_PATH'] = os.path.join(workdir, 'memory.sqlite3')
+    os.environ['BROADCAST_DB_PATH'] = os.path.join(workdir, 'memory.sqlite3')
+    os.environ['STREAM_REPLIES'] = '1' if args.stream else '0'
+    os.environ['BROADCAST_RATE'] = str(args.broadcast_rate)
+    os.environ['BROADCAST_PER_CHAT_INTERVAL'] = '0'
+    os.environ.setdefault('OPENAI_API_KEY', 'offline-benchmark')
+    os.environ.setdefault('EMBEDDINGS_REFRESH_SECONDS', '0')
+    write_synthetic_corpus(os.path.join(source_dir, os.getenv('EMBEDDINGS_KEY', 'transcript_embeddings.json')), args.corpus, args.dim)
+
+
+#Replace the OpenAI clients and local models with the offline stand-ins, then load the rest (corpus, index, chains)
+def install_fakes(args):
+    from models_initialization import llm, summary_llm, emotion_classifier, TokenUsageCallback
+    from context_retrieval import retrieval_model
+    from warmup import warm_up
+    #Registers the chains, so the warm-up builds them too
+    import bot_interactions
+
+    llm.set(FakeChatModel(latency=args.llm_latency, tokens_per_second=args.tokens_per_second, callbacks=[TokenUsageCallback('reply')]))
+    summary_llm.set(FakeChatModel(latency=args.llm_latency, tokens_per_second=args.tokens_per_second, callbacks=[TokenUsageCallback('summary')]))
+    retrieval_model.set(FakeEncoder(dim=args.dim))
+    emotion_classifier.set(FakeEmotionClassifier())
+    return warm_up()
+
+
+def summarize_latencies(latencies, elapsed):
+    values = np.asarray(latencies) * 1000
+    if not len(values):
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean_ms': round(float(values.mean()), 2),
+        'p50_ms': round(float(np.percentile(values, 50)), 2),
+        'p95_ms': round(float(np.percentile(values, 95)), 2),
+        'p99_ms': round(float(np.percentile(values, 99)), 2),
+        'per_second': round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+
+
+#Mean duration of each pipeline stage, from the histograms the bot records anyway
+def stage_means_ms():
+    from metrics import stage_seconds
+    sums, counts = {}, {}
+    for name, labels, value in stage_seconds.samples():
+        stage = dict(labels).get('stage')
+        if name.endswith('_sum'):
+            sums[stage] = value
+        elif name.endswith('_count'):
+            counts[stage] = value
+    return {stage: round(sums[stage] / counts[stage] * 1000, 2) for stage in sorted(sums) if counts.get(stage)}
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+#One user: /start, their name, then the scripted turns; records the latency of every scripted turn
+async def simulate_user(user_id, turns, bot, latencies, think_time):
+    from bot_interactions import start, handle_message
+    context = make_context(bot)
+    await start(make_update(user_id, '/start'), context)
+    await handle_message(make_update(user_id, 'Alex'), context)
+    for turn in range(turns):
+        line = conversation_script[(user_id + turn) % len(conversation_script)]
+        text = line + prompt_details[(user_id * 3 + turn) % len(prompt_details)]
+        began = time.perf_counter()
+        await handle_message(make_update(user_id, text), context)
+        latencies.append(time.perf_counter() - began)
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def run_async_phases(args, bot):
+    from bot_interactions import daily_check_in, flush_summaries
+    import bot_interactions
+    results = {}
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(simulate_user(user_id, args.turns, bot, latencies, args.think_time) for user_id in range(1, args.users + 1)))
+    results['handle_message'] = summarize_latencies(latencies, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await flush_summaries(None)
+    results['summary_flush'] = {'seconds': round(time.perf_counter() - start, 3)}
+
+    start = time.perf_counter()
+    await daily_check_in(SimpleNamespace(bot=bot))
+    elapsed = time.perf_counter() - start
+    stats = bot_interactions.check_in_broadcaster.stats
+    results['daily_check_in'] = {'sent': stats['sent'], 'seconds': round(elapsed, 3),
+                                 'per_second': round(stats['sent'] / elapsed, 2) if elapsed > 0 else 0.0}
+    return results
+
+
+#The synchronous retrieval path: every query is new, so each one encodes and searches the corpus
+def run_retrieval_phase(queries):
+    from context_retrieval import retrieve_similar_transcripts_chain
+    latencies = []
+    start = time.perf_counter()
+    for i in range(queries):
+        began = time.perf_counter()
+        retrieve_similar_transcripts_chain(f"{conversation_script[i % len(conversation_script)]} (query {i})")
+        latencies.append(time.perf_counter() - began)
+    return summarize_latencies(latencies, time.perf_counter() - start)
+
+
+def run(args):
+    with tempfile.TemporaryDirectory(prefix='mentaai-bench-') as workdir:
+        configure_environment(args, workdir)
+        start = time.perf_counter()
+        warmup = install_fakes(args)
+        setup_seconds = time.perf_counter() - start
+
+        bot = FakeBot(latency=args.bot_latency)
+        results = asyncio.run(run_async_phases(args, bot))
+        results['retrieval_chain'] = run_retrieval_phase(args.retrieval_queries)
+
+        from context_retrieval import retrieval_cache
+        from metrics import llm_tokens, prompt_tokens
+        results['stages_mean_ms'] = stage_means_ms()
+        results['retrieval_cache'] = retrieval_cache.stats()
+        results['llm_tokens'] = {f"{dict(labels)['purpose']}_{dict(labels)['direction']}": value for _, labels, value in llm_tokens.samples()}
+        results['prompt_tokens'] = {f"{dict(labels)['section']}_{dict(labels)['kind']}": value for _, labels, value in prompt_tokens.samples()}
+        results['bot_calls'] = dict(bot.calls)
+        results['process'] = {'peak_rss_mb': peak_rss_mb(), 'setup_seconds': round(setup_seconds, 3), 'warmup': warmup}
+
+    config = {key: value for key, value in vars(args).items() if key not in ('save_baseline', 'compare', 'tolerance', 'log_level')}
+    return {'config': config, 'results': results}
+
+
+def print_report(report):
+    results = report['results']
+    print(f"config: {json.dumps(report['config'], sort_keys=True)}")
+    print(f"{'section':<18}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'per s':>10}")
+    for section in ('handle_message', 'retrieval_chain'):
+        r = results[section]
+        if r.get('count'):
+            print(f"{section:<18}{r['count']:>8}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['per_second']:>10.1f}")
+    check_in = results['daily_check_in']
+    print(f"daily_check_in: {check_in['sent']} sent in {check_in['seconds']}s ({check_in['per_second']}/s)")
+    print(f"summary flush: {results['summary_flush']['seconds']}s")
+    print(f"stage means (ms): {results['stages_mean_ms']}")
+    print(f"retrieval cache: {results['retrieval_cache']}")
+    print(f"llm tokens: {results['llm_tokens']}  bot calls: {results['bot_calls']}")
+    print(f"prompt section tokens: {results['prompt_tokens']}")
+    print(f"peak RSS: {results['process']['peak_rss_mb']} MB")
+
+
+#Compare with a saved baseline; returns the list of results that got worse by more than the tolerance
+def compare_with_baseline(report, baseline, tolerance):
+    if baseline.get('config') != report['config']:
+        print("warning: baseline was recorded with a different configuration")
+    regressions = []
+    print(f"{'result':<30}{'baseline':>12}{'current':>12}{'change':>10}")
+    for section, field, higher_is_better in tracked_results:
+        old = baseline['results'].get(section, {}).get(field)
+        new = report['results'].get(section, {}).get(field)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        name = f"{section}.{field}"
+        print(f"{name:<30}{old:>12.2f}{new:>12.2f}{change:>+10.1%}{'  REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the bot with a fake LLM, bot and corpus")
+    parser.add_argument('--users', type=int, default=100, help="Simulated users talking at the same time")
+    parser.add_argument('--turns', type=int, default=5, help="Scripted messages per user after /start and the name")
+    parser.add_argument('--think-time', type=float, default=0.0, help="Seconds each user waits between messages")
+    parser.add_argument('--corpus', type=int, default=20000, help="Size of the synthetic embedding corpus")
+    parser.add_argument('--dim', type=int, default=384, help="Embedding dimension")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="Seconds before the fake LLM starts answering")
+    parser.add_argument('--tokens-per-second', type=float, default=50.0, help="Output rate of the fake LLM")
+    parser.add_argument('--bot-latency', type=float, default=0.02, help="Seconds per fake Telegram API call")
+    parser.add_argument('--broadcast-rate', type=float, default=1000.0, help="Check-in messages per second allowed by the broadcaster")
+    parser.add_argument('--retrieval-queries', type=int, default=200, help="Calls of the synchronous retrieval chain")
+    parser.add_argument('--stream', action=argparse.BooleanOptionalAction, default=True, help="Stream replies (STREAM_REPLIES)")
+    parser.add_argument('--save-baseline', help="Write the report as JSON to this file")
+    parser.add_argument('--compare', help="Compare with a baseline JSON file; exits with 1 on a regression")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Allowed relative change before a result counts as a regression")
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    report = run(args)
+    print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import time
+import argparse
+import numpy as np
+from retrieval_index import BruteForceIndex, build_index, index_backends
+
+#Recall/latency benchmark of every retrieval index backend against exact brute-force search
+#Usage: python benchmark_retrieval.py --synthetic 100000 --dim 384 --queries 200 --k 2
+
+
+#Random unit vectors grouped around a few hundred topics, roughly mimicking sentence embeddings
+def synthetic_corpus(count, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((max(1, count // 200), dim)).astype(np.float32)
+    matrix = topics[rng.integers(0, len(topics), size=count)] + 0.6 * rng.standard_normal((count, dim)).astype(np.float32)
+    return matrix
+
+
+#Queries are perturbed copies of corpus rows, so each has a meaningful set of true neighbours
+def make_queries(matrix, count, seed=1):
+    rng = np.random.default_rng(seed)
+    rows = np.asarray(matrix[rng.integers(0, matrix.shape[0], size=count)], dtype=np.float32)
+    return rows + 0.3 * rng.standard_normal(rows.shape).astype(np.float32)
+
+
+def percentile_ms(latencies, q):
+    return float(np.percentile(latencies, q) * 1000)
+
+
+def run_benchmark(matrix, queries, k, backends):
+    reference = BruteForceIndex(matrix)
+    expected = [set(reference.search(query, k)[0].tolist()) for query in queries]
+
+    print(f"corpus={matrix.shape[0]} dim={matrix.shape[1]} queries={len(queries)} k={k}")
+    print(f"{'backend':<16}{'build s':>10}{'p50 ms':>10}{'p95 ms':>10}{'recall@k':>10}")
+    for backend in backends:
+        try:
+            start = time.perf_counter()
+            index = build_index(matrix, backend)
+            build_seconds = time.perf_counter() - start
+        except ValueError as e:
+            print(f"{backend:<16}skipped: {e}")
+            continue
+
+        latencies = []
+        hits = 0
+        for query, truth in zip(queries, expected):
+            start = time.perf_counter()
+            indices, _ = index.search(query, k)
+            latencies.append(time.perf_counter() - start)
+            hits += len(truth & set(indices.tolist()))
+        recall = hits / max(1, sum(len(truth) for truth in expected))
+        print(f"{backend:<16}{build_seconds:>10.2f}{percentile_ms(latencies, 50):>10.3f}{percentile_ms(latencies, 95):>10.3f}{recall:>10.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval index backends against exact search")
+    parser.add_argument('--synthetic', type=int, default=0, help="Use a synthetic corpus of this size instead of the cached embedding store")
+    parser.add_argument('--dim', type=int, default=384, help="Dimension of the synthetic corpus")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=2)
+    parser.add_argument('--backends', default=','.join(index_backends), help="Comma-separated list of backends to compare")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        matrix = synthetic_corpus(args.synthetic, args.dim)
+    else:
+        from download_embeddings import load_embeddings_from_s3
+        matrix = load_embeddings_from_s3().embeddings
+
+    run_benchmark(matrix, make_queries(matrix, args.queries), args.k, args.backends.split(','))
+
+
+if __name__ == '__main__':
+    main()
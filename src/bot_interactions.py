@@ -1,15 +1,28 @@
 import os
+import time
+import asyncio
 import logging
+from datetime import datetime
+from pytz import timezone
 from telegram import Update
+from telegram.constants import ChatAction
 from telegram.ext import ContextTypes
 from crisis_processing import detect_crisis, crisis_response
-from context_retrieval import retrieve_similar_transcripts_chain
-from models_initialization import emotion_classifier, client_manager_system_message, llm
-from proxy_setup import create_http_client_with_proxy
+from context_retrieval import aretrieve_examples, format_examples, embedding_batcher, retrieval_cache
+from models_initialization import emotion_batcher, client_manager_system_message, llm, summary_llm
+from concurrency import run_stage, run_blocking, get_user_lock, inference_queue_depth, user_locks
+from summary_scheduler import SummaryScheduler
+from memory_store import UserMemoryManager
+from broadcast import Broadcaster
+from streaming import StreamingReply, stream_replies
+from warmup import LazyResource, is_ready, start_warm_up, wait_until_ready, warmup_report
+from prompt_builder import build_sections
+from http_transport import close_shared_clients
+from metrics import registry, stage_timer, stage_seconds, instrument_handler, first_text_seconds, start_metrics
 from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationSummaryMemory, ConversationBufferWindowMemory
-from langchain_openai import ChatOpenAI
+from langchain.prompts import ChatPromptTemplate, HumanMessagePromptTemplate
+from langchain.memory.prompt import SUMMARY_PROMPT
+from langchain_core.messages import AIMessage, HumanMessage, get_buffer_string
 from dotenv import load_dotenv
 
 #Load environment variables
@@ -18,132 +31,236 @@ load_dotenv()
 #Set up logging to capture information and errors for debugging
 logger = logging.getLogger(__name__)
 
-#Initialize user state to keep track of user-specific data
-user_state = {}
+#User messages, memory and replies are only logged when explicitly enabled, at DEBUG level on a separate logger
+log_prompts = os.getenv('LOG_PROMPTS', '0') == '1'
+prompt_logger = logging.getLogger('mentaai.prompts')
+if log_prompts:
+    prompt_logger.setLevel(logging.DEBUG)
 
-#Initialize conversation memories
-user_memories = {}
+#Check-in days follow UK time, matching the schedule in main.py
+uk_time = timezone('Europe/London')
 
-#Set up an HTTP client with proxy 
-http_client_summary = create_http_client_with_proxy()
+#Bounded store of user state and conversation memory, spilling idle users to disk
+memory_manager = UserMemoryManager()
+
+#Seconds a message waits for the startup warm-up before the bot asks the user to retry
+warmup_wait_seconds = float(os.getenv('WARMUP_WAIT_SECONDS', '30'))
+
+#Per-stage timeouts (seconds) for the independent steps that run before the LLM call
+memory_stage_timeout = float(os.getenv('MEMORY_STAGE_TIMEOUT', '2'))
+retrieval_stage_timeout = float(os.getenv('RETRIEVAL_STAGE_TIMEOUT', '3'))
+emotion_stage_timeout = float(os.getenv('EMOTION_STAGE_TIMEOUT', '2'))
 
 #Define a prompt template for generating responses using the language model chain
-prompt_template = PromptTemplate(
-    input_variables=["system_message", "retrieved_context", "memory_context", "user_name", "prompt", "emotion"],
-    template="""
-    Instructions:
-    {system_message}
-    User's name: {user_name}
-    Memory Context:
-    {memory_context}
-    {retrieved_context}
-    Client: {prompt}
-    Detected Emotion: {emotion}
-    Counselor:
-    """
-)
+#The long system message comes first and never changes, so the provider can reuse its cached prefix;
+#everything that varies per user or per message follows it in the human message
+prompt_template = ChatPromptTemplate.from_messages([
+    client_manager_system_message,
+    HumanMessagePromptTemplate.from_template(
+        "User's name: {user_name}\n"
+        "Memory Context:\n"
+        "{memory_context}\n"
+        "{retrieved_context}\n"
+        "Client: {prompt}\n"
+        "Detected Emotion: {emotion}\n"
+        "Counselor:"
+    ),
+])
 
 #Create a language model chain with the defined prompt template
-llm_chain = LLMChain(llm=llm, prompt=prompt_template)
-
-#Initialize global conversation memory
-def initialize_memory(user_id):
-    if user_id not in user_memories:
-        user_memories[user_id] = {
-            'buffer_memory': ConversationBufferWindowMemory(k=3),
-            'summary_memory': ConversationSummaryMemory(
-                llm=ChatOpenAI(api_key=os.getenv('OPENAI_API_KEY'), model='gpt-4o', http_client=http_client_summary, temperature=0.3),
-                return_messages=True
-            )
-        }
-
-#Function to manage conversation memory and retrieve the user's name
+llm_chain = LazyResource('llm_chain', lambda: LLMChain(llm=llm.get(), prompt=prompt_template))
+
+#The same prompt and model as a runnable, which can stream the reply token by token
+llm_stream_chain = LazyResource('llm_stream_chain', lambda: prompt_template | llm.get())
+
+#Chain that folds new conversation lines into a running summary, shared by all users
+summary_chain = LazyResource('summary_chain', lambda: LLMChain(llm=summary_llm.get(), prompt=SUMMARY_PROMPT))
+
+#Format turns the way the conversation buffer did ("Human: ...\nAI: ...")
+def format_turns(turns):
+    messages = []
+    for prompt, response in turns:
+        messages.extend([HumanMessage(content=prompt), AIMessage(content=response)])
+    return get_buffer_string(messages)
+
+#Fold buffered turns into the user's running summary with a single LLM call
+async def summarize_turns(user_id, turns):
+    with stage_timer('summary'):
+        summary = await summary_chain.get().apredict(summary=memory_manager.get(user_id).summary, new_lines=format_turns(turns))
+    memory_manager.set_summary(user_id, summary)
+    logger.info(f"Summary updated for user {user_id} with {len(turns)} turns")
+
+#Deferred summarization: turns are summarized every few turns or after the user goes idle
+summary_scheduler = SummaryScheduler(summarize_turns)
+
+#Queue depths and the stats other components already keep, read whenever metrics are scraped or dumped
+def collect_queue_depths():
+    return {
+        'inference_queue_depth': inference_queue_depth(),
+        'active_user_locks': len(user_locks),
+        'update_queue_depth': update_queue.qsize() if update_queue is not None else 0,
+    }
+
+def collect_batchers():
+    batchers = [emotion_batcher, embedding_batcher]
+    return {key: {batcher.name: batcher.stats()[key] for batcher in batchers} for key in ('pending', 'batches', 'items', 'mean_batch_size')}
+
+def collect_warmup():
+    return {
+        'ready': int(is_ready()),
+        'load_seconds': {name: value for name, value in warmup_report.items() if name != 'total'},
+        'total_seconds': warmup_report.get('total', 0),
+    }
+
+registry.register_collector('mentaai', collect_queue_depths)
+registry.register_collector('mentaai_memory', memory_manager.stats)
+registry.register_collector('mentaai_summary', summary_scheduler.stats)
+registry.register_collector('mentaai_retrieval_cache', retrieval_cache.stats)
+registry.register_collector('mentaai_batcher', collect_batchers, label='model')
+registry.register_collector('mentaai_warmup', collect_warmup, label='component')
+registry.register_collector('mentaai_broadcast', lambda: check_in_broadcaster.stats if check_in_broadcaster is not None else {})
+
+#Telegram updates received but not yet picked up by a handler, set once the application is running
+update_queue = None
+
+#Load the heavy models in background threads once the bot is up; cheap handlers answer meanwhile
+#The metrics endpoint (if METRICS_PORT is set) starts here too, as it needs the running event loop
+async def warm_up_models(application, metrics_port=None):
+    global update_queue
+    update_queue = application.update_queue
+    start_warm_up()
+    await start_metrics(metrics_port)
+
+#Finish queued model batches and summarize all buffered turns before the bot shuts down, then close the shared API connections
+async def flush_summaries(application):
+    for batcher in (emotion_batcher, embedding_batcher):
+        await batcher.close()
+    await summary_scheduler.flush()
+    await run_blocking(memory_manager.flush)
+    await close_shared_clients()
+
+#Function to load conversation memory (summary and recent turns) and retrieve the user's name
 def memory_chain(user_id):
-    initialize_memory(user_id)
+    memory = memory_manager.get(user_id)
+
     #Retrieve conversation memory context
-    buffer_memory = user_memories[user_id]['buffer_memory']
-    summary_memory = user_memories[user_id]['summary_memory']
-    try:
-        buffer_context = buffer_memory.load_memory_variables({}).get('history', [])
-        logger.info(f"Buffer context loaded for user {user_id}: {buffer_context}")
-    except Exception as e:
-        buffer_context = []
-        logger.error(f"Error loading buffer memory for user {user_id}: {e}")
-    
-    try:
-        summary_list = summary_memory.load_memory_variables({}).get('history', [])
-        summary_context = "\n".join([msg.content for msg in summary_list]) if summary_list else ""
-        logger.info(f"Summary context loaded for user {user_id}: {summary_context}")
-    except Exception as e:
-        summary_context = ""
-        logger.error(f"Error loading summary memory for user {user_id}: {e}")
+    prompt_logger.debug("Recent turns loaded for user %s: %s", user_id, memory.recent_turns)
+    prompt_logger.debug("Summary context loaded for user %s: %s", user_id, memory.summary)
 
-    #Combine buffer and summary contexts
-    memory_context = f"Summary:\n{summary_context}\n\nRecent Interactions:\n{buffer_context}"
     #Retrieve the user's name from the state
-    user_name = user_state.get(user_id, {}).get("name", "")
-    
-    return memory_context, user_name
+    user_name = memory.name or ""
+
+    return memory.summary, memory.recent_turns, user_name
+
+#Async wrapper so memory loading can run alongside the other pre-LLM stages
+async def load_memory_stage(user_id):
+    return await run_blocking(memory_chain, user_id)
+
+#Retrieve similar transcripts to use as context; encoding is batched with other users' prompts
+async def retrieval_stage(prompt):
+    return await aretrieve_examples(prompt)
+
+#Detect the dominant emotion in the user's input; classification is batched with other users' prompts
+async def emotion_stage(prompt):
+    emotion_scores = await emotion_batcher.submit(prompt)
+    return max(emotion_scores, key=lambda x: x['score'])['label']
+
+#Gather everything the prompt needs: memory, retrieved examples and the detected emotion
+#user_name is the name the caller already read, so the memory fallback needs no read of the store on the event loop
+async def prepare_prompt_inputs(prompt, user_id, user_name=""):
+    #Run memory loading, retrieval and emotion detection in parallel, each with its own fallback
+    fallback_memory = ("", (), user_name)
+    (summary, recent_turns, user_name), examples, emotion = await asyncio.gather(
+        run_stage('memory', load_memory_stage(user_id), memory_stage_timeout, fallback_memory),
+        run_stage('retrieval', retrieval_stage(prompt), retrieval_stage_timeout, []),
+        run_stage('emotion', emotion_stage(prompt), emotion_stage_timeout, "neutral")
+    )
+
+    #Fit summary, recent turns and examples into their token budgets
+    memory_context, retrieved_context, token_report = build_sections(summary, recent_turns, examples, format_turns, format_examples)
+    logger.debug("Prompt sections for user %s: %s", user_id, token_report)
+
+    prompt_inputs = {
+        "retrieved_context": retrieved_context,
+        "memory_context": memory_context,
+        "user_name": user_name,
+        "prompt": prompt,
+        "emotion": emotion
+    }
+
+    #The full prompt is only rendered when prompt logging is enabled
+    if prompt_logger.isEnabledFor(logging.DEBUG):
+        prompt_logger.debug("Full prompt for LLM: %s", prompt_template.format(**prompt_inputs))
+
+    return prompt_inputs
+
+#Save a completed turn for future interactions
+def save_turn(user_id, prompt, response_content):
+    #Log user input and response
+    prompt_logger.debug("User input: %s | Response: %s", prompt, response_content)
+
+    with stage_timer('save_turn'):
+        memory_manager.add_turn(user_id, prompt, response_content)
+    #Fold the turn into the summary later, in the background, so the reply is not held up by a second LLM call
+    summary_scheduler.add_turn(user_id, prompt, response_content)
 
 #Function to generate a response based on user input, detected emotion, and retrieved context
-def generate_response(prompt, user_id):
+async def generate_response(prompt, user_id, user_name=""):
     try:
-        #Retrieve conversation memory and user's name
-        memory_context, user_name = memory_chain(user_id)
-        #Retrieve similar transcripts to use as context
-        retrieved_context = retrieve_similar_transcripts_chain(prompt)
-        #Detect emotion in the user's input
-        emotion_scores = emotion_classifier(prompt)
-        emotion = max(emotion_scores[0], key=lambda x: x['score'])['label']
-
-        #Build the full prompt for logging
-        full_prompt = f"""
-        {client_manager_system_message.content}
-        User's name: {user_name}
-        Memory Context:
-        {memory_context}
-        {retrieved_context}
-        Client: {prompt}
-        Detected Emotion: {emotion}
-        Counselor:
-        """
-        logger.info(f"Full prompt for LLM: {full_prompt}")  #Log full prompt
-        
+        prompt_inputs = await prepare_prompt_inputs(prompt, user_id, user_name)
+
         #Generate the response using the language model chain
-        response_content = llm_chain.run({
-            "system_message": client_manager_system_message.content,
-            "retrieved_context": retrieved_context,
-            "memory_context": memory_context,
-            "user_name": user_name,
-            "prompt": prompt,
-            "emotion": emotion
-        })
-
-        #Log user input and response
-        logger.info(f"User input: {prompt} | Response: {response_content}")
-
-        #Save the context for future interactions
-        user_memories[user_id]['buffer_memory'].save_context({"input": prompt}, {"output": response_content})
-        user_memories[user_id]['summary_memory'].save_context({"input": prompt}, {"output": response_content})
+        with stage_timer('llm'):
+            response_content = await llm_chain.get().arun(prompt_inputs)
+
+        save_turn(user_id, prompt, response_content)
         return response_content
     except Exception as e:
         logger.error(f"Error generating response: {e}")
         raise
 
+#Streaming variant of generate_response: yields text chunks as the model produces them
+#The turn is saved to memory only once the stream has completed
+async def stream_response(prompt, user_id, user_name=""):
+    try:
+        prompt_inputs = await prepare_prompt_inputs(prompt, user_id, user_name)
+
+        chunks = []
+        #Includes the time the caller spends showing each chunk, which is what the user waits for
+        with stage_timer('llm'):
+            async for chunk in llm_stream_chain.get().astream(prompt_inputs):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    yield chunk.content
+
+        save_turn(user_id, prompt, "".join(chunks))
+    except Exception as e:
+        logger.error(f"Error streaming response: {e}")
+        raise
+
+#Rate-limited, resumable sender for the daily check-ins, created with the first run
+check_in_broadcaster = None
+
 #Daily check-ins to ask users how they are feeling
+@instrument_handler('daily_check_in')
 async def daily_check_in(application):
-    for user_id, user_data in user_state.items():
-        if user_data.get('awaiting_name') is False: # Check if the bot is not awaiting the user's name
-            check_in_message = "Hi! Just checking in to see how you're doing today. How are you feeling?"
-            logger.info(f"Sending check-in message to user {user_id}")
-            await application.bot.send_message(chat_id=user_id, text=check_in_message)
-        else:
-            logger.info(f"Skipping user {user_id} because they are still awaiting name")
+    global check_in_broadcaster
+    if check_in_broadcaster is None:
+        check_in_broadcaster = Broadcaster(application.bot, on_blocked=memory_manager.set_blocked)
+    #Only users who are not still being asked for their name and have not blocked the bot, including those spilled to disk
+    user_ids = memory_manager.named_user_ids()
+    check_in_message = "Hi! Just checking in to see how you're doing today. How are you feeling?"
+    #One job per UK calendar day, so a restarted run resumes without messaging anyone twice
+    job_id = f"daily_check_in:{datetime.now(uk_time).date().isoformat()}"
+    await check_in_broadcaster.broadcast(job_id, user_ids, check_in_message)
 
 #Define the start command handler to initialize the conversation
+@instrument_handler('start')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     logger.info("Start command received")
+    #A user who writes to the bot has unblocked it, so daily check-ins resume
+    memory_manager.set_blocked(user_id, False)
 
     #Initial welcome message
     welcome_message = "Hi there! I'm MentaAI, your intelligent NLP-based mental health assistant. 😊"
@@ -167,47 +284,92 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await context.bot.send_message(chat_id=update.effective_chat.id, text=ask_name_message)
 
     #Set the state to indicate that the bot is waiting for the user's name
-    user_state[user_id] = {"awaiting_name": True}
+    memory_manager.set_awaiting_name(user_id)
 
 #Restart function
+@instrument_handler('restart')
 async def restart(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    #Clear the user's memory
-    if user_id in user_memories:
-        del user_memories[user_id]
-    #Clear the user's state
-    if user_id in user_state:
-        del user_state[user_id]
+    #Wait for any in-flight reply of this user before clearing their data
+    async with get_user_lock(user_id):
+        #Clear the user's memory, including turns not yet summarized
+        summary_scheduler.discard(user_id)
+        #Clear the user's state and memory, in RAM and on disk
+        memory_manager.delete(user_id)
     #Send a confirmation message to the user
     await context.bot.send_message(chat_id=update.effective_chat.id, text="The conversation has been restarted. Let's start fresh! 😊")
     #Trigger the start command
     await start(update, context)
 
+#Stream the reply into the chat: typing indicator first, then the first sentence, then progressive edits
+async def send_streamed_reply(update, context, user_input, user_id, user_name=""):
+    reply = StreamingReply(context.bot, update.effective_chat.id)
+    await reply.start()
+    try:
+        async for chunk in stream_response(user_input, user_id, user_name):
+            await reply.feed(chunk)
+        await reply.finish()
+        if reply.first_visible_seconds is not None:
+            first_text_seconds.observe(reply.first_visible_seconds, mode='stream')
+        prompt_logger.debug("Streamed response for user %s: %s", user_id, reply.text)
+    except Exception as e:
+        reply.cancel()
+        logger.error(f"Error generating response for user {user_id}: {e}")
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="An error occurred. Please try again later.")
+
 #Define the message handler for processing user input and generating responses
+@instrument_handler('handle_message')
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     user_input = update.message.text.strip()
 
-    logger.info(f"Handling message for user {user_id}, input: {user_input}")
+    prompt_logger.debug("Handling message for user %s, input: %s", user_id, user_input)
+    #A user who writes to the bot has unblocked it, so daily check-ins resume
+    memory_manager.set_blocked(user_id, False)
 
-    #Check if the user is still setting their name
-    if user_id in user_state and user_state[user_id].get("awaiting_name"):
-        if user_input.isalpha() and user_input.istitle():
-            user_state[user_id] = {"name": user_input, "awaiting_name": False}
-            ask_help_message = f"Nice to meet you, {user_input}! How are you feeling today? You can ask me something like, 'I'm feeling anxious today, can you help?'"
-            await context.bot.send_message(chat_id=update.effective_chat.id, text=ask_help_message)
-        else:
-            reask_name_message = "Please enter just your first name, starting with a capital letter, without any spaces or special characters."
-            await context.bot.send_message(chat_id=update.effective_chat.id, text=reask_name_message)
-    else:
-        #Handle the actual user input
-        if detect_crisis(user_input):
+    #Crisis replies never wait behind a pending reply, even for the same user
+    if not memory_manager.get(user_id).awaiting_name:
+        with stage_timer('crisis_detection'):
+            is_crisis = detect_crisis(user_input)
+        if is_crisis:
             await crisis_response(update, context)
+            return
+
+    #Time spent queued behind this user's previous message
+    lock_wait_start = time.perf_counter()
+
+    #Process this user's messages one at a time and in order, other users run concurrently
+    async with get_user_lock(user_id):
+        stage_seconds.observe(time.perf_counter() - lock_wait_start, stage='user_lock_wait')
+        memory = memory_manager.get(user_id)
+        #Check if the user is still setting their name
+        if memory.awaiting_name:
+            if user_input.isalpha() and user_input.istitle():
+                memory_manager.set_name(user_id, user_input)
+                ask_help_message = f"Nice to meet you, {user_input}! How are you feeling today? You can ask me something like, 'I'm feeling anxious today, can you help?'"
+                await context.bot.send_message(chat_id=update.effective_chat.id, text=ask_help_message)
+            else:
+                reask_name_message = "Please enter just your first name, starting with a capital letter, without any spaces or special characters."
+                await context.bot.send_message(chat_id=update.effective_chat.id, text=reask_name_message)
         else:
+            #Until the models are warm, hold the message for a while, then degrade instead of blocking
+            if not is_ready():
+                await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
+                if not await wait_until_ready(warmup_wait_seconds):
+                    warming_up_message = "I'm still getting ready and need a few more moments. Please send your message again shortly. 🙏"
+                    await context.bot.send_message(chat_id=update.effective_chat.id, text=warming_up_message)
+                    return
+
+            #Handle the actual user input
+            if stream_replies:
+                await send_streamed_reply(update, context, user_input, user_id, memory.name or "")
+                return
             try:
-                response = generate_response(user_input, user_id)
-                logger.info(f"Generated response for user {user_id}: {response[:30]}...")
+                reply_start = time.perf_counter()
+                response = await generate_response(user_input, user_id, memory.name or "")
+                prompt_logger.debug("Generated response for user %s: %s", user_id, response)
                 await context.bot.send_message(chat_id=update.effective_chat.id, text=response)
+                first_text_seconds.observe(time.perf_counter() - reply_start, mode='complete')
             except Exception as e:
                 logger.error(f"Error generating response for user {user_id}: {e}")
-                await context.bot.send_message(chat_id=update.effective_chat.id, text="An error occurred. Please try again later.")
\ No newline at end of file
+                await context.bot.send_message(chat_id=update.effective_chat.id, text="An error occurred. Please try again later.")
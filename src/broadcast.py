@@ -0,0 +1,189 @@
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from concurrency import run_blocking
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Broadcast limits; Telegram allows about 30 messages per second overall and about one per second per chat
+broadcast_concurrency = int(os.getenv('BROADCAST_CONCURRENCY', '20'))
+broadcast_rate = float(os.getenv('BROADCAST_RATE', '25'))
+broadcast_per_chat_interval = float(os.getenv('BROADCAST_PER_CHAT_INTERVAL', '1'))
+broadcast_max_attempts = int(os.getenv('BROADCAST_MAX_ATTEMPTS', '3'))
+broadcast_db_path = os.getenv('BROADCAST_DB_PATH', os.getenv('MEMORY_DB_PATH', 'user_memory.sqlite3'))
+
+#Checkpoints older than this are pruned when a new broadcast starts
+checkpoint_retention_seconds = 7 * 24 * 3600
+
+#Checkpoints are written in batches on the blocking pool, never on the event loop; after a crash the users of the last
+#unwritten batch (at most this many, or one interval's worth) may get the message a second time
+checkpoint_batch_size = 50
+checkpoint_interval = 1.0
+
+
+#Token bucket shared by all senders; a flood-control pause from Telegram stops every sender at once
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = None
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+#Sends one message to many users with bounded concurrency, rate limits, retries and a resumable checkpoint
+#bot is anything with an async send_message(chat_id=..., text=...), e.g. telegram.Bot or a test double
+#on_blocked, if given, is called with the user id of every user who blocked the bot
+class Broadcaster:
+    def __init__(self, bot, db_path=None, concurrency=None, rate=None, per_chat_interval=None, max_attempts=None, on_blocked=None):
+        self.bot = bot
+        self.on_blocked = on_blocked
+        self.concurrency = concurrency or broadcast_concurrency
+        self.bucket = TokenBucket(rate or broadcast_rate)
+        self.per_chat_interval = broadcast_per_chat_interval if per_chat_interval is None else per_chat_interval
+        self.max_attempts = max_attempts or broadcast_max_attempts
+        self._last_sent = {}
+        self._db = sqlite3.connect(db_path or broadcast_db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS broadcast_progress ("
+            "job_id TEXT NOT NULL, user_id INTEGER NOT NULL, status TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (job_id, user_id))"
+        )
+        self._db.commit()
+        self._progress = []
+        self._last_checkpoint = time.monotonic()
+        self._checkpoint_lock = asyncio.Lock()
+        self.stats = {}
+
+    #Users already handled by this job in a previous (possibly crashed) run
+    def completed_user_ids(self, job_id):
+        rows = self._db.execute("SELECT user_id FROM broadcast_progress WHERE job_id = ?", (job_id,)).fetchall()
+        return {user_id for (user_id,) in rows}
+
+    def _record(self, job_id, user_id, status):
+        self._progress.append((job_id, user_id, status, time.time()))
+        self.stats[status] += 1
+
+    def _write_progress(self, rows):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO broadcast_progress (job_id, user_id, status, updated_at) VALUES (?, ?, ?, ?)", rows
+        )
+        self._db.commit()
+
+    #Write the recorded results once a batch is full or the interval has passed (always with force=True)
+    async def _checkpoint(self, force=False):
+        if not self._progress:
+            return
+        if not force and len(self._progress) < checkpoint_batch_size and time.monotonic() - self._last_checkpoint < checkpoint_interval:
+            return
+        async with self._checkpoint_lock:
+            rows, self._progress = self._progress, []
+            self._last_checkpoint = time.monotonic()
+            if rows:
+                try:
+                    await run_blocking(self._write_progress, rows)
+                except sqlite3.Error as e:
+                    logger.error(f"Writing {len(rows)} broadcast checkpoints failed: {e}")
+
+    def _prepare(self, job_id):
+        self._db.execute("DELETE FROM broadcast_progress WHERE updated_at < ?", (time.time() - checkpoint_retention_seconds,))
+        self._db.commit()
+        return self.completed_user_ids(job_id)
+
+    #Keep at least per_chat_interval seconds between two messages to the same chat
+    async def _wait_for_chat(self, user_id):
+        last_sent = self._last_sent.get(user_id)
+        if last_sent is not None:
+            delay = last_sent + self.per_chat_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _send(self, job_id, user_id, text):
+        for attempt in range(1, self.max_attempts + 1):
+            await self._wait_for_chat(user_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=user_id, text=text)
+                self._last_sent[user_id] = time.monotonic()
+                self._record(job_id, user_id, 'sent')
+                return
+            except RetryAfter as e:
+                #Flood control applies to the whole bot, so pause every sender and retry this user
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else float(e.retry_after)
+                logger.warning(f"Flood control hit, pausing broadcast for {retry_after}s")
+                self.bucket.pause(retry_after)
+                self.stats['retried'] += 1
+            except Forbidden:
+                #The user blocked the bot or deleted their account; do not retry, today or in later broadcasts
+                self._record(job_id, user_id, 'blocked')
+                if self.on_blocked is not None:
+                    self.on_blocked(user_id)
+                return
+            except BadRequest as e:
+                logger.warning(f"Broadcast to user {user_id} rejected: {e}")
+                self._record(job_id, user_id, 'failed')
+                return
+            except NetworkError as e:
+                logger.warning(f"Network error sending to user {user_id} (attempt {attempt}): {e}")
+                self.stats['retried'] += 1
+                await asyncio.sleep(min(30, 2 ** attempt))
+        self._record(job_id, user_id, 'failed')
+
+    #Send text to every user once per job_id; rerunning the same job only sends to users not yet handled
+    async def broadcast(self, job_id, user_ids, text):
+        completed = await run_blocking(self._prepare, job_id)
+        pending = [user_id for user_id in user_ids if user_id not in completed]
+        self.stats = {'job_id': job_id, 'total': len(user_ids), 'resumed_skipped': len(user_ids) - len(pending),
+                      'sent': 0, 'blocked': 0, 'failed': 0, 'retried': 0}
+        logger.info(f"Broadcast {job_id}: {len(pending)} users to message, {self.stats['resumed_skipped']} already done")
+
+        #A fixed pool of senders pulls from one iterator, so memory does not grow with the user count
+        start = time.monotonic()
+        remaining = iter(pending)
+
+        async def sender():
+            for user_id in remaining:
+                try:
+                    await self._send(job_id, user_id, text)
+                except Exception as e:
+                    logger.error(f"Unexpected error broadcasting to user {user_id}: {e}")
+                    self._record(job_id, user_id, 'failed')
+                await self._checkpoint()
+
+        await asyncio.gather(*(sender() for _ in range(min(self.concurrency, max(1, len(pending))))))
+        await self._checkpoint(force=True)
+
+        elapsed = time.monotonic() - start
+        self.stats['elapsed_seconds'] = round(elapsed, 3)
+        self.stats['messages_per_second'] = round(self.stats['sent'] / elapsed, 2) if elapsed > 0 else 0.0
+        logger.info(f"Broadcast {job_id} finished: {self.stats}")
+        return self.stats
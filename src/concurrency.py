@@ -0,0 +1,61 @@
+import os
+import asyncio
+import functools
+import logging
+import weakref
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import stage_seconds, stage_outcomes
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Bounded thread pool for blocking model inference so the event loop keeps serving other users
+inference_workers = int(os.getenv('INFERENCE_WORKERS', '4'))
+inference_executor = ThreadPoolExecutor(max_workers=inference_workers, thread_name_prefix='inference')
+
+#Per-user locks, dropped automatically once no handler holds or waits on them
+user_locks = weakref.WeakValueDictionary()
+
+
+#Run a blocking function on the inference pool without blocking the event loop
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(inference_executor, functools.partial(func, *args, **kwargs))
+
+
+#Number of blocking calls waiting for a free inference thread
+def inference_queue_depth():
+    return inference_executor._work_queue.qsize()
+
+
+#Return the lock that serializes updates of a single user, preserving their message order
+def get_user_lock(user_id):
+    lock = user_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        user_locks[user_id] = lock
+    return lock
+
+
+#Await one pipeline stage with a timeout, returning the fallback if it is too slow or fails
+#Every stage's duration and outcome is recorded in the stage metrics
+async def run_stage(name, awaitable, timeout, fallback):
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        return await asyncio.wait_for(awaitable, timeout=timeout)
+    except asyncio.TimeoutError:
+        outcome = 'timeout'
+        logger.warning(f"Stage '{name}' timed out after {timeout}s, using fallback")
+    except Exception as e:
+        outcome = 'error'
+        logger.error(f"Stage '{name}' failed, using fallback: {e}")
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=name)
+        stage_outcomes.inc(stage=name, outcome=outcome)
+    return fallback
@@ -1,45 +1,134 @@
-import torch
-from sentence_transformers import SentenceTransformer, util
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+import numpy as np
 from download_embeddings import load_embeddings_from_s3
+from retrieval_index import build_index
+from inference_backends import load_sentence_encoder, retrieval_model_name
+from batching import MicroBatcher
+from concurrency import run_blocking
+from semantic_cache import SemanticCache
+from warmup import LazyResource
 
-#Load the embeddings from S3 directly into memory
-embedding_data = load_embeddings_from_s3()
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
 
-#Convert embeddings to a torch tensor and move to the appropriate device
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-embeddings = torch.tensor(embedding_data['embeddings']).to(device)
-chunks = embedding_data['pairs']
+#Number of examples to retrieve and the minimum cosine similarity for an example to be used
+retrieval_top_k = int(os.getenv('RETRIEVAL_TOP_K', '2'))
+retrieval_score_threshold = float(os.getenv('RETRIEVAL_SCORE_THRESHOLD', '-1'))
 
-#Load the retrieval model and move it to the appropriate device
-retrieval_model = SentenceTransformer('all-MiniLM-L6-v2')
-retrieval_model = retrieval_model.to(device)
+#The embedding store together with the search index built over it
+Corpus = namedtuple('Corpus', ['store', 'index'])
 
-#Function to retrieve similar transcripts based on the user's input
-def retrieve_similar_transcripts_chain(prompt):
-    #Encode the user's prompt to the same device as embeddings
-    user_embedding = retrieval_model.encode(prompt, convert_to_tensor=True).to(device)
-    #Calculate cosine similarities between the user's embedding and the stored embeddings
-    similarities = util.pytorch_cos_sim(user_embedding, embeddings)[0]
-    #Get the top 2 most similar responses
-    top_indices = torch.topk(similarities, k=2).indices.tolist()
+#Load the embedding store (memory-mapped from the local cache) and build the configured search index
+def load_corpus():
+    store = load_embeddings_from_s3()
+    return Corpus(store, build_index(store.embeddings))
+
+#Load the retrieval model on the backend chosen by INFERENCE_BACKEND / RETRIEVAL_INFERENCE_BACKEND
+def load_retrieval_model():
+    return load_sentence_encoder(retrieval_model_name)
+
+#Heavy components are loaded on first use or by the startup warm-up, not at import time
+corpus = LazyResource('embedding_corpus', load_corpus)
+retrieval_model = LazyResource('retrieval_model', load_retrieval_model)
+
+#Batch concurrent prompt encodings into a single forward pass
+embedding_batcher = MicroBatcher('retrieval_model', lambda prompts: list(retrieval_model.get().encode(prompts, convert_to_numpy=True, batch_size=len(prompts))))
+
+#Retrieval results are cached per prompt and per near-duplicate query, tied to the corpus version
+retrieval_cache = SemanticCache()
+
+#Seconds between revalidations of the corpus against its source; 0 disables them
+embeddings_refresh_seconds = float(os.getenv('EMBEDDINGS_REFRESH_SECONDS', '0'))
+
+#Revalidate the corpus and swap in a new version and index if it changed; cached results of the old version are dropped
+def refresh_embeddings():
+    store = load_embeddings_from_s3()
+    if store.version == corpus.get().store.version:
+        return False
+    corpus.set(Corpus(store, build_index(store.embeddings)))
+    logger.info(f"Switched to embedding corpus version {store.version}")
+    return True
+
+def refresh_embeddings_periodically():
+    while True:
+        time.sleep(embeddings_refresh_seconds)
+        try:
+            refresh_embeddings()
+        except Exception as e:
+            logger.error(f"Error refreshing embeddings: {e}")
 
+if embeddings_refresh_seconds > 0:
+    threading.Thread(target=refresh_embeddings_periodically, name='embeddings-refresh', daemon=True).start()
+
+#Introduces the retrieved examples in the prompt
+retrieved_context_header = "Incorporate the following real-life examples into your responses to make them more relatable and human-like, ensuring they align with the user's current situation:\n"
+
+#Look up the (client, counselor) pairs of the search results, best match first
+def select_examples(top_indices, top_scores, pairs):
     #Prepare the retrieved context with the corresponding counselor messages
     results = []
-    scores_cpu = similarities.cpu().numpy()
-    for idx in top_indices:
-        if idx >= len(chunks):
+    for idx, score in zip(np.asarray(top_indices).tolist(), np.asarray(top_scores).tolist()):
+        if idx >= len(pairs) or score < retrieval_score_threshold:
             continue
-        client_message, counselor_message = chunks[idx]
+        client_message, counselor_message = pairs[idx]
         results.append({
             'client': client_message.strip(),
             'counselor': counselor_message.strip(),
-            'score': scores_cpu[idx]
+            'score': score
         })
+    return results
 
-    #Compile the retrieved context into a structured format
-    retrieved_context = "Incorporate the following real-life examples into your responses to make them more relatable and human-like, ensuring they align with the user's current situation:\n"
-    for transcript in results:
+#Compile retrieved examples into the structured context added to the prompt
+def format_examples(examples):
+    retrieved_context = retrieved_context_header
+    for transcript in examples:
         retrieved_context += f"(Client): {transcript['client']}\n"
         retrieved_context += f"(Counselor): {transcript['counselor']}\n\n"
+    return retrieved_context
+
+def format_retrieved_context(top_indices, top_scores, pairs):
+    return format_examples(select_examples(top_indices, top_scores, pairs))
+
+#Find the examples for an already encoded prompt, reusing a near-duplicate query's results if possible
+def search_examples(user_embedding, prompt=None):
+    #Use one consistent corpus version even if a refresh swaps it meanwhile
+    store, index = corpus.get()
+    cached = retrieval_cache.get_similar(user_embedding, store.version)
+    if cached is not None:
+        top_indices, top_scores = cached.indices, cached.scores
+    else:
+        #Find the most similar stored examples using the configured index
+        top_indices, top_scores = index.search(np.asarray(user_embedding, dtype=np.float32), retrieval_top_k)
+        #Only a real search adds an entry; storing similar hits again would let entries drift away from their searches
+        retrieval_cache.put(prompt, user_embedding, top_indices, top_scores, store.version)
+    return select_examples(top_indices, top_scores, store.pairs)
+
+def build_retrieved_context(user_embedding, prompt=None):
+    return format_examples(search_examples(user_embedding, prompt))
+
+#Function to retrieve similar transcripts based on the user's input
+def retrieve_similar_transcripts_chain(prompt):
+    store = corpus.get().store
+    cached = retrieval_cache.get_exact(prompt, store.version)
+    if cached is not None:
+        return format_retrieved_context(cached.indices, cached.scores, store.pairs)
+    #Encode the user's prompt
+    user_embedding = retrieval_model.get().encode(prompt, convert_to_numpy=True)
+    return build_retrieved_context(user_embedding, prompt)
+
+#Async variant returning the examples themselves; shares the encoder forward pass with other concurrent prompts
+async def aretrieve_examples(prompt):
+    #Never load the corpus on the event loop
+    store = (corpus.get() if corpus.is_loaded() else await run_blocking(corpus.get)).store
+    cached = retrieval_cache.get_exact(prompt, store.version)
+    if cached is not None:
+        return select_examples(cached.indices, cached.scores, store.pairs)
+    user_embedding = await embedding_batcher.submit(prompt)
+    return await run_blocking(search_examples, user_embedding, prompt)
 
-    return retrieved_context
\ No newline at end of file
+async def aretrieve_similar_transcripts(prompt):
+    return format_examples(await aretrieve_examples(prompt))
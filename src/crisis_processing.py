@@ -1,33 +1,91 @@
+import re
 import logging
+from collections import namedtuple
 from telegram import Update
 from telegram.ext import ContextTypes
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from resources import critical_keywords, dangerous_keywords
+from metrics import instrument_handler
 
 #Set up logging to capture information and errors for debugging
 logger = logging.getLogger(__name__)
 
+#Message text and matched keywords are only logged at DEBUG level on the prompt logger (see LOG_PROMPTS)
+prompt_logger = logging.getLogger('mentaai.prompts')
+
 #Initialize sentiment analyzer for detecting emotional tone in user messages
 analyzer = SentimentIntensityAnalyzer()
 
+#Canonical form shared by keywords and messages: lowercase, apostrophes dropped, punctuation and spacing collapsed
+#so that "I can't go on", "i cant go on" and "I can’t  go on" all read the same
+apostrophe_pattern = re.compile(r"['\u2018\u2019\u02bc`]")
+separator_pattern = re.compile(r"[^\w]+")
+
+def canonicalize(text):
+    return separator_pattern.sub(" ", apostrophe_pattern.sub("", text.lower())).strip()
+
+#Result of a keyword scan: the original keywords that fired, per list
+CrisisMatch = namedtuple('CrisisMatch', ['critical', 'dangerous'])
+
+#Compile both keyword lists into one regex that finds every keyword start in a single scan
+def build_crisis_matcher(critical, dangerous):
+    categories = {}
+    for category, keywords in (('critical', critical), ('dangerous', dangerous)):
+        for keyword in keywords:
+            entries = categories.setdefault(canonicalize(keyword), [])
+            if (category, keyword) not in entries:
+                entries.append((category, keyword))
+
+    #A match of a longer keyword also implies every keyword that is its prefix at the same position
+    implied = {
+        form: [other for other in categories if form.startswith(other)]
+        for form in categories
+    }
+
+    #Longest alternatives first; the lookahead lets overlapping keywords at different positions all match
+    alternatives = "|".join(re.escape(form) for form in sorted(categories, key=len, reverse=True))
+    pattern = re.compile(rf"(?<!\w)(?=({alternatives}))")
+    return pattern, categories, implied
+
+crisis_pattern, keyword_categories, implied_keywords = build_crisis_matcher(critical_keywords, dangerous_keywords)
+
+#Scan the message once and report which critical and dangerous keywords it contains
+def match_crisis_keywords(message):
+    fired = {'critical': [], 'dangerous': []}
+    seen = set()
+    for match in crisis_pattern.finditer(canonicalize(message)):
+        for form in implied_keywords[match.group(1)]:
+            if form in seen:
+                continue
+            seen.add(form)
+            for category, keyword in keyword_categories[form]:
+                fired[category].append(keyword)
+    return CrisisMatch(tuple(fired['critical']), tuple(fired['dangerous']))
+
 #Function to detect crisis situations based on keywords and sentiment analysis
 def detect_crisis(message):
     #Check for critical and dangerous keywords in the user's message
-    contains_critical_keyword = any(keyword in message.lower() for keyword in critical_keywords)
-    contains_dangerous_keyword = any(keyword in message.lower() for keyword in dangerous_keywords)
-    #Analyze the sentiment score of the message
-    sentiment_score = analyzer.polarity_scores(message)['compound']
-    logger.info(f"Sentiment score: {sentiment_score} for message: {message[:30]}...")  # Anonymized logging
+    matches = match_crisis_keywords(message)
+
     #Trigger crisis response immediately if a critical keyword is found
-    if contains_critical_keyword:
+    if matches.critical:
+        logger.info("Crisis detected by a critical keyword")
+        prompt_logger.debug("Critical keywords matched: %s", list(matches.critical))
         return True
+
+    #Without a dangerous keyword the sentiment cannot change the outcome, so skip scoring it
+    if not matches.dangerous:
+        return False
+
+    #Analyze the sentiment score of the message
+    sentiment_score = analyzer.polarity_scores(message)['compound']
+    prompt_logger.debug("Sentiment score %s for message %s (dangerous keywords: %s)", sentiment_score, message, list(matches.dangerous))
+
     #Trigger crisis response if a dangerous keyword is found and sentiment is below the threshold
-    if contains_dangerous_keyword and sentiment_score <= -0.65:
-        return True
-    #Otherwise, do not trigger crisis response
-    return False
+    return sentiment_score <= -0.65
 
 #Function to send a crisis response with UK-specific resources
+@instrument_handler('crisis_response')
 async def crisis_response(update: Update, context: ContextTypes.DEFAULT_TYPE):
     #Immediate supportive response to a detected crisis situation
     crisis_message = (
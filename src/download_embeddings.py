@@ -1,24 +1,197 @@
 import os
-import boto3
 import json
+import mmap
+import shutil
+import hashlib
+import logging
+import tempfile
+import numpy as np
 from dotenv import load_dotenv
 
 #Load environment variables
 load_dotenv()
 
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Location of the source corpus; EMBEDDINGS_SOURCE_DIR replaces the S3 bucket with a local directory
+bucket_name = os.getenv('EMBEDDINGS_BUCKET', 'mentaai-embeddings')
+key = os.getenv('EMBEDDINGS_KEY', 'transcript_embeddings.json')
+source_dir = os.getenv('EMBEDDINGS_SOURCE_DIR')
+
+#Local cache holding the binary store built from the JSON corpus
+cache_dir = os.getenv('EMBEDDINGS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'mentaai', 'embeddings'))
+
+#Precision of the stored matrix; float16 halves disk and page cache usage
+embeddings_dtype = os.getenv('EMBEDDINGS_DTYPE', 'float32')
+
+#Bump when the on-disk layout changes so stale caches are rebuilt
+store_format_version = 1
+
+
+#Read-only view of the (client, counselor) pairs backed by a memory-mapped file and an offset index
+class PairsFile:
+    def __init__(self, directory):
+        self.offsets = np.load(os.path.join(directory, 'pairs_offsets.npy'), mmap_mode='r')
+        self._file = open(os.path.join(directory, 'pairs.bin'), 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        return tuple(json.loads(self._data[start:end].decode('utf-8')))
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+#Memory-mapped embedding matrix plus transcript pairs, shared through the page cache across processes
+class EmbeddingStore:
+    def __init__(self, directory, version):
+        self.directory = directory
+        self.version = version
+        self.embeddings = np.load(os.path.join(directory, 'embeddings.npy'), mmap_mode='r')
+        self.pairs = PairsFile(directory)
+
+
+#The production corpus in S3, validated by the object's ETag
+class S3Source:
+    def __init__(self, bucket, object_key):
+        import boto3
+        #Load AWS credentials from environment variables
+        self.s3 = boto3.client('s3',
+                               aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                               aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'))
+        self.bucket = bucket
+        self.key = object_key
+
+    def etag(self):
+        return self.s3.head_object(Bucket=self.bucket, Key=self.key)['ETag'].strip('"')
+
+    def fetch(self, destination):
+        #Stream the file to disk instead of holding it in memory
+        self.s3.download_file(self.bucket, self.key, destination)
+
+
+#A directory standing in for the bucket, validated by file size and modification time
+class LocalSource:
+    def __init__(self, directory, object_key):
+        self.path = os.path.join(directory, object_key)
+
+    def etag(self):
+        stat = os.stat(self.path)
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    def fetch(self, destination):
+        shutil.copyfile(self.path, destination)
+
+
+def get_source():
+    if source_dir:
+        return LocalSource(source_dir, key)
+    return S3Source(bucket_name, key)
+
+
+#Identifier of a built store; changes whenever the source object or the stored layout changes
+def store_version(etag, dtype):
+    return hashlib.sha1(f"{etag}:{dtype}:{store_format_version}".encode('utf-8')).hexdigest()[:16]
+
+
+#Convert the JSON corpus into the binary layout inside an empty directory
+def build_store(json_path, directory, dtype):
+    with open(json_path, 'r', encoding='utf-8') as f:
+        embeddings_data = json.load(f)
+
+    matrix = np.asarray(embeddings_data['embeddings'], dtype=dtype)
+    np.save(os.path.join(directory, 'embeddings.npy'), matrix)
+
+    #Write each pair as a JSON record and index it by byte offset
+    offsets = [0]
+    with open(os.path.join(directory, 'pairs.bin'), 'wb') as f:
+        for pair in embeddings_data['pairs']:
+            record = json.dumps(list(pair), ensure_ascii=False).encode('utf-8')
+            f.write(record)
+            offsets.append(offsets[-1] + len(record))
+    np.save(os.path.join(directory, 'pairs_offsets.npy'), np.asarray(offsets, dtype=np.uint64))
+
+    logger.info(f"Built embedding store with {matrix.shape[0]} vectors of dimension {matrix.shape[1] if matrix.ndim > 1 else 0} ({dtype})")
+
+
+def read_current_version():
+    try:
+        with open(os.path.join(cache_dir, 'current.json'), 'r') as f:
+            return json.load(f)['version']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def write_current_version(version, etag):
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'version': version, 'etag': etag, 'dtype': embeddings_dtype}, f)
+    os.replace(tmp_path, os.path.join(cache_dir, 'current.json'))
+
+
+#Drop store versions other than the current one; open memory maps stay valid on POSIX
+def remove_stale_versions(current):
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name != current and os.path.isdir(path) and not name.startswith('.'):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+#Download the corpus and build a new store version; concurrent builders race safely on the final rename
+def refresh_store(source, etag, version):
+    target = os.path.join(cache_dir, version)
+    if not os.path.isdir(target):
+        build_dir = tempfile.mkdtemp(dir=cache_dir, prefix='.build-')
+        try:
+            json_path = os.path.join(build_dir, 'source.json')
+            source.fetch(json_path)
+            build_store(json_path, build_dir, embeddings_dtype)
+            os.remove(json_path)
+            try:
+                os.rename(build_dir, target)
+            except OSError:
+                #Another process finished building the same version first
+                if not os.path.isdir(target):
+                    raise
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+    write_current_version(version, etag)
+    remove_stale_versions(version)
+    return target
+
+
+#Load the embedding store, rebuilding the local cache only when the source ETag has changed
 def load_embeddings_from_s3():
-    #Load AWS credentials from environment variables
-    aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-    aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-    
-    s3 = boto3.client('s3', 
-                      aws_access_key_id=aws_access_key_id,
-                      aws_secret_access_key=aws_secret_access_key)
-    bucket_name = 'mentaai-embeddings'
-    key = 'transcript_embeddings.json'
-
-    #Download the file directly to memory
-    response = s3.get_object(Bucket=bucket_name, Key=key)
-    embeddings_data = json.loads(response['Body'].read().decode('utf-8'))
-
-    return embeddings_data
\ No newline at end of file
+    os.makedirs(cache_dir, exist_ok=True)
+    source = get_source()
+    cached_version = read_current_version()
+
+    try:
+        etag = source.etag()
+    except Exception as e:
+        #Keep serving from the cache if the source is unreachable
+        if cached_version and os.path.isdir(os.path.join(cache_dir, cached_version)):
+            logger.warning(f"Could not revalidate embeddings, using cached version {cached_version}: {e}")
+            return EmbeddingStore(os.path.join(cache_dir, cached_version), cached_version)
+        raise
+
+    version = store_version(etag, embeddings_dtype)
+    directory = os.path.join(cache_dir, version)
+    if version == cached_version and os.path.isdir(directory):
+        logger.info(f"Embedding cache is up to date (version {version})")
+    else:
+        logger.info(f"Embedding cache is stale or missing, building version {version}")
+        directory = refresh_store(source, etag, version)
+
+    return EmbeddingStore(directory, version)
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from http import HTTPStatus
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Limits that keep a single slow or oversized client from tying up the server
+max_body_bytes = 1024 * 1024
+read_timeout = 30
+
+
+#Minimal HTTP/1.1 server for the webhook and metrics endpoints, built on asyncio streams
+#routes maps (method, path) to a coroutine called as handler(headers, body) that returns (status, content_type, payload)
+async def serve_http(host, port, routes):
+    async def handle_connection(reader, writer):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), timeout=read_timeout)
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), timeout=read_timeout)
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', '0'))
+                if length > max_body_bytes:
+                    await write_response(writer, 413, 'text/plain', b'Payload Too Large', close=True)
+                    break
+                body = await asyncio.wait_for(reader.readexactly(length), timeout=read_timeout) if length else b''
+
+                handler = routes.get((method, target.split('?', 1)[0]))
+                if handler is None:
+                    status, content_type, payload = 404, 'text/plain', b'Not Found'
+                else:
+                    try:
+                        status, content_type, payload = await handler(headers, body)
+                    except Exception as e:
+                        logger.error(f"Error handling {method} {target}: {e}")
+                        status, content_type, payload = 500, 'text/plain', b'Internal Server Error'
+
+                close = version == 'HTTP/1.0' or headers.get('connection', '').lower() == 'close'
+                await write_response(writer, status, content_type, payload, close=close)
+                if close:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle_connection, host, port)
+
+
+async def write_response(writer, status, content_type, payload, close=False):
+    head = (
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+    )
+    writer.write(head.encode('latin-1') + payload)
+    await writer.drain()
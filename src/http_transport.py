@@ -0,0 +1,197 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import importlib.util
+import httpx
+from metrics import registry
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Optional proxy for all outgoing API calls
+proxy = os.getenv('PROXY')
+
+#Connection pool shared by every model client in the process
+http_max_connections = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+http_max_keepalive = int(os.getenv('HTTP_MAX_KEEPALIVE', '20'))
+http_keepalive_expiry = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+#HTTP/2 multiplexes requests over one connection; it needs the h2 package (pip install httpx[http2])
+http2_enabled = os.getenv('HTTP2', '1') == '1' and importlib.util.find_spec('h2') is not None
+
+#Timeouts in seconds; read covers the gaps between streamed chunks, pool the wait for a free connection
+http_connect_timeout = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+http_read_timeout = float(os.getenv('HTTP_READ_TIMEOUT', '60'))
+http_write_timeout = float(os.getenv('HTTP_WRITE_TIMEOUT', '10'))
+http_pool_timeout = float(os.getenv('HTTP_POOL_TIMEOUT', '10'))
+
+#Retries of rate-limited (429) and failed (5xx, connection error) requests with jittered exponential backoff
+http_max_retries = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+http_backoff_base = float(os.getenv('HTTP_BACKOFF_BASE', '0.5'))
+http_backoff_max = float(os.getenv('HTTP_BACKOFF_MAX', '20'))
+
+#After this many consecutive failures a host is not called for a while, so requests fail fast instead of piling up
+circuit_failure_threshold = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+circuit_reset_seconds = float(os.getenv('CIRCUIT_RESET_SECONDS', '30'))
+
+retry_status_codes = {429, 500, 502, 503, 504}
+
+http_requests = registry.counter('mentaai_http_requests_total', "Outgoing API requests by host and result")
+http_retries = registry.counter('mentaai_http_retries_total', "Retried outgoing API requests by host and reason")
+
+
+#Raised while a host's circuit is open; a transport error, so API clients report it as a connection error
+class CircuitOpenError(httpx.TransportError):
+    pass
+
+
+#Consecutive-failure circuit breaker for one host: closed -> open (fail fast) -> half open (one trial request) -> closed
+class CircuitBreaker:
+    def __init__(self, failure_threshold=None, reset_seconds=None):
+        self.failure_threshold = failure_threshold or circuit_failure_threshold
+        self.reset_seconds = circuit_reset_seconds if reset_seconds is None else reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.reset_seconds else 'open'
+
+    def allow(self):
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self.trial_running:
+            self.trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_running = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+#Delay before a retry: the server's Retry-After if it sent one, otherwise full-jitter exponential backoff
+def retry_delay(attempt, response=None):
+    if response is not None:
+        retry_after = response.headers.get('retry-after')
+        if retry_after:
+            try:
+                return min(http_backoff_max, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+    return random.uniform(0, min(http_backoff_max, http_backoff_base * 2 ** attempt))
+
+
+#Pooled async transport with retries and a circuit breaker per host, shared by every API client
+class ResilientTransport(httpx.AsyncBaseTransport):
+    def __init__(self, max_retries=None):
+        self.max_retries = http_max_retries if max_retries is None else max_retries
+        self.limits = httpx.Limits(max_connections=http_max_connections, max_keepalive_connections=http_max_keepalive,
+                                   keepalive_expiry=http_keepalive_expiry)
+        self._transport = httpx.AsyncHTTPTransport(http2=http2_enabled, limits=self.limits, proxy=proxy)
+        self.breakers = {}
+        self.in_flight = 0
+
+    async def handle_async_request(self, request):
+        host = request.url.host
+        breaker = self.breakers.setdefault(host, CircuitBreaker())
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                http_requests.inc(host=host, result='circuit_open')
+                raise CircuitOpenError(f"Circuit open for {host} after {breaker.failures} consecutive failures", request=request)
+
+            self.in_flight += 1
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                if attempt >= self.max_retries:
+                    http_requests.inc(host=host, result='error')
+                    raise
+                http_retries.inc(host=host, reason=type(e).__name__)
+                logger.warning(f"Request to {host} failed ({type(e).__name__}), retrying (attempt {attempt + 1})")
+                await asyncio.sleep(retry_delay(attempt))
+                attempt += 1
+                continue
+            finally:
+                self.in_flight -= 1
+                #A trial that is cancelled (or otherwise never gets a result) must not keep the circuit open forever
+                breaker.trial_running = False
+
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                #A 429 means the service is up but throttling us, so it does not open the circuit
+                breaker.record_success()
+            if response.status_code not in retry_status_codes or attempt >= self.max_retries:
+                http_requests.inc(host=host, result=str(response.status_code))
+                return response
+
+            delay = retry_delay(attempt, response)
+            await response.aclose()
+            http_retries.inc(host=host, reason=str(response.status_code))
+            logger.warning(f"Request to {host} returned {response.status_code}, retrying in {delay:.1f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+    #Pool utilization; connection details come from httpcore's pool and are skipped if its internals change
+    def stats(self):
+        stats = {
+            #Requests sent and waiting for response headers
+            'in_flight_requests': self.in_flight,
+            'max_connections': self.limits.max_connections,
+            'http2': int(http2_enabled),
+            'circuit_open': {host: int(breaker.state != 'closed') for host, breaker in self.breakers.items()},
+            'consecutive_failures': {host: breaker.failures for host, breaker in self.breakers.items()},
+        }
+        try:
+            connections = list(self._transport._pool.connections)
+            stats['connections'] = len(connections)
+            stats['idle_connections'] = sum(1 for connection in connections if connection.is_idle())
+            stats['active_connections'] = stats['connections'] - stats['idle_connections']
+            stats['waiting_requests'] = sum(1 for pool_request in self._transport._pool._requests if pool_request.is_queued())
+        except AttributeError:
+            pass
+        return stats
+
+
+def create_timeout():
+    return httpx.Timeout(connect=http_connect_timeout, read=http_read_timeout, write=http_write_timeout, pool=http_pool_timeout)
+
+
+#The process-wide async client; every ChatOpenAI uses it, so all LLM calls share one keep-alive pool
+shared_transport = ResilientTransport()
+shared_async_client = httpx.AsyncClient(transport=shared_transport, timeout=create_timeout())
+
+#Blocking calls (not used by the bot's handlers) get a plain client with the same proxy, limits and timeouts
+shared_sync_client = httpx.Client(proxy=proxy, limits=shared_transport.limits, timeout=create_timeout())
+
+registry.register_collector('mentaai_http', shared_transport.stats, label='host')
+
+if proxy:
+    logger.info("Outgoing API calls use the configured proxy.")
+
+
+async def close_shared_clients():
+    await shared_async_client.aclose()
+    shared_sync_client.close()
@@ -0,0 +1,131 @@
+import os
+import logging
+import numpy as np
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#How the local models run on CPU: 'torch' (fp32, default), 'quantized' (int8 dynamic quantization) or 'onnx' (ONNX Runtime, needs optimum)
+inference_backend = os.getenv('INFERENCE_BACKEND', 'torch')
+emotion_backend = os.getenv('EMOTION_INFERENCE_BACKEND', inference_backend)
+retrieval_backend = os.getenv('RETRIEVAL_INFERENCE_BACKEND', inference_backend)
+
+#Intra-op threads per forward pass (0 leaves the library default, usually one per core); several inference
+#workers each using every core oversubscribe the CPU, so INFERENCE_WORKERS x INFERENCE_THREADS ~ cores works best
+inference_threads = int(os.getenv('INFERENCE_THREADS', '0'))
+
+#Exported ONNX graphs are kept here so only the first start pays for the export
+onnx_cache_dir = os.getenv('ONNX_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'mentaai', 'onnx'))
+
+inference_backends = ('torch', 'quantized', 'onnx')
+
+#Local models; the stored corpus was encoded with the retrieval model, so queries must use the same one
+emotion_model_name = "j-hartmann/emotion-english-distilroberta-base"
+#Full hub id: the transformers and optimum loaders, unlike SentenceTransformer, do not add the sentence-transformers/ prefix
+retrieval_model_name = 'sentence-transformers/all-MiniLM-L6-v2'
+
+
+def check_backend(backend):
+    if backend not in inference_backends:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of: {', '.join(inference_backends)}")
+
+
+def configure_torch_threads(threads=None):
+    threads = inference_threads if threads is None else threads
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+
+#int8 weights for every Linear layer; activations are quantized on the fly, so no calibration data is needed
+def quantize(model):
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def onnx_session_options(threads=None):
+    import onnxruntime
+    threads = inference_threads if threads is None else threads
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads > 0:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return options
+
+
+#Load an ONNX Runtime model, exporting it from the Hugging Face checkpoint on first use
+def load_onnx_model(model_class_name, model_name, threads=None):
+    try:
+        import optimum.onnxruntime as ort
+    except ImportError:
+        raise ValueError("The 'onnx' inference backend requires the optimum package (pip install optimum[onnxruntime])")
+    model_class = getattr(ort, model_class_name)
+    export_dir = os.path.join(onnx_cache_dir, model_name.replace('/', '--'))
+    options = onnx_session_options(threads)
+    if os.path.isdir(export_dir):
+        return model_class.from_pretrained(export_dir, session_options=options, provider='CPUExecutionProvider')
+    logger.info(f"Exporting {model_name} to ONNX in {export_dir}")
+    model = model_class.from_pretrained(model_name, export=True, session_options=options, provider='CPUExecutionProvider')
+    model.save_pretrained(export_dir)
+    return model
+
+
+#Text classification pipeline (all label scores per input) on the chosen backend
+def load_text_classifier(model_name, backend=None, threads=None):
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
+    backend = backend or emotion_backend
+    check_backend(backend)
+    if backend == 'onnx':
+        model = load_onnx_model('ORTModelForSequenceClassification', model_name, threads)
+        return pipeline("text-classification", model=model, tokenizer=AutoTokenizer.from_pretrained(model_name), top_k=None)
+
+    configure_torch_threads(threads)
+    if backend == 'quantized':
+        model = quantize(AutoModelForSequenceClassification.from_pretrained(model_name).eval())
+        return pipeline("text-classification", model=model, tokenizer=AutoTokenizer.from_pretrained(model_name), top_k=None)
+    return pipeline("text-classification", model=model_name, top_k=None)
+
+
+#Sentence encoder on ONNX Runtime with the same interface and output as SentenceTransformer.encode
+#for mean-pooled, L2-normalized models such as all-MiniLM-L6-v2
+class OnnxSentenceEncoder:
+    def __init__(self, model_name, threads=None, max_length=256):
+        from transformers import AutoTokenizer
+        self.model = load_onnx_model('ORTModelForFeatureExtraction', model_name, threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.max_length = max_length
+
+    def _encode_batch(self, texts):
+        inputs = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors='np')
+        hidden = np.asarray(self.model(**inputs).last_hidden_state, dtype=np.float32)
+        mask = inputs['attention_mask'][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def encode(self, sentences, convert_to_numpy=True, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        batch_size = max(1, batch_size)
+        embeddings = np.concatenate([self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]) if texts else np.empty((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+
+#Sentence embedding model on the chosen backend; only the torch backend uses a GPU when one is available
+def load_sentence_encoder(model_name, backend=None, threads=None):
+    backend = backend or retrieval_backend
+    check_backend(backend)
+    if backend == 'onnx':
+        return OnnxSentenceEncoder(model_name, threads)
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+    configure_torch_threads(threads)
+    if backend == 'quantized':
+        return quantize(SentenceTransformer(model_name, device='cpu').eval())
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    return SentenceTransformer(model_name).to(device)
@@ -4,7 +4,7 @@ from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, fil
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from pytz import timezone
-from bot_interactions import start, restart, handle_message, daily_check_in
+from bot_interactions import start, restart, handle_message, daily_check_in, flush_summaries, warm_up_models
 from dotenv import load_dotenv
 
 #Load environment variables
@@ -22,19 +22,34 @@ logger = logging.getLogger(__name__)
 
 logger.info("Bot is starting...")
 
-#Main function to start the bot and set up scheduled tasks
-def main():
-    application = ApplicationBuilder().token(os.getenv('TELEGRAM_TOKEN')).build()
+#Build the Telegram application with all handlers registered; webhook workers pass updater=False
+def build_application(updater=True):
+    #Handle updates concurrently; per-user ordering is enforced inside the handlers
+    max_concurrent_updates = int(os.getenv('MAX_CONCURRENT_UPDATES', '256'))
+    builder = ApplicationBuilder().token(os.getenv('TELEGRAM_TOKEN')).concurrent_updates(max_concurrent_updates).post_init(warm_up_models).post_shutdown(flush_summaries)
+    if not updater:
+        builder = builder.updater(None)
+    application = builder.build()
     application.add_handler(CommandHandler('start', start))
     application.add_handler(CommandHandler('restart', restart))  # Add the restart command handler
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    return application
+
+#Create the scheduler for daily check-ins; it must run in exactly one process
+def create_scheduler(application):
     #Initialize the scheduler
     scheduler = AsyncIOScheduler()
     #Schedule daily check-ins at 8 PM UK time every day
     scheduler.add_job(daily_check_in, CronTrigger(hour=20, timezone=uk_time), args=[application])
+    return scheduler
+
+#Main function to start the bot and set up scheduled tasks
+def main():
+    application = build_application()
+    scheduler = create_scheduler(application)
     scheduler.start()
     #Start the bot
     application.run_polling()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
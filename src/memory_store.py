@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Memory limits: number of users kept in RAM and idle seconds before a user is spilled to disk
+memory_max_users = int(os.getenv('MEMORY_MAX_USERS', '10000'))
+memory_idle_ttl = float(os.getenv('MEMORY_IDLE_TTL', '3600'))
+memory_db_path = os.getenv('MEMORY_DB_PATH', 'user_memory.sqlite3')
+
+#Persist every change right away (on the writer thread) so a restarted process (or another worker) loses nothing
+memory_write_through = os.getenv('MEMORY_WRITE_THROUGH', '0') == '1'
+
+#Number of recent turns kept verbatim; older turns only survive in the summary
+recent_turns_window = 3
+
+
+#Conversations are stored in plain text, so the database file is created readable and writable by its owner only;
+#SQLite gives its -wal and -shm files the same permissions
+def restrict_permissions(db_path):
+    if db_path == ':memory:' or db_path.startswith('file:'):
+        return
+    try:
+        os.close(os.open(db_path, os.O_RDWR | os.O_CREAT, 0o600))
+        os.chmod(db_path, 0o600)
+    except OSError as e:
+        logger.warning(f"Could not restrict permissions of {db_path}: {e}")
+
+
+#Compact per-user state: the name flow, the last few turns and the running summary, as plain strings
+class UserMemory:
+    __slots__ = ('user_id', 'name', 'awaiting_name', 'recent_turns', 'summary', 'last_seen', 'blocked')
+
+    def __init__(self, user_id, name=None, awaiting_name=None, recent_turns=(), summary="", last_seen=None, blocked=False):
+        self.user_id = user_id
+        self.name = name
+        #None until the user runs /start, True while the bot waits for their name, then False
+        self.awaiting_name = awaiting_name
+        self.recent_turns = tuple(tuple(turn) for turn in recent_turns)
+        self.summary = summary
+        self.last_seen = last_seen or time.time()
+        #True once Telegram reported that the user blocked the bot, until they write again
+        self.blocked = blocked
+
+    def add_turn(self, prompt, response):
+        self.recent_turns = (self.recent_turns + ((prompt, response),))[-recent_turns_window:]
+
+    def to_record(self):
+        return json.dumps({
+            'name': self.name,
+            'awaiting_name': self.awaiting_name,
+            'recent_turns': self.recent_turns,
+            'summary': self.summary,
+        })
+
+    @classmethod
+    def from_record(cls, user_id, record, last_seen, blocked=False):
+        data = json.loads(record)
+        return cls(user_id, data.get('name'), data.get('awaiting_name'), data.get('recent_turns', ()), data.get('summary', ""), last_seen,
+                   bool(blocked))
+
+
+#Keeps at most max_users memories in RAM (LRU plus idle TTL) and spills the rest to a local SQLite file
+#Writes are queued to a single writer thread, so callers (including the event loop) never wait for a commit
+class UserMemoryManager:
+    def __init__(self, db_path=None, max_users=None, idle_ttl=None, write_through=None):
+        self.max_users = max_users or memory_max_users
+        self.idle_ttl = memory_idle_ttl if idle_ttl is None else idle_ttl
+        self.write_through = memory_write_through if write_through is None else write_through
+        self._hot = OrderedDict()
+        self._lock = threading.RLock()
+        db_path = db_path or memory_db_path
+        restrict_permissions(db_path)
+        #Several worker processes may share the file, so wait for their write locks instead of failing
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS user_memory ("
+            "user_id INTEGER PRIMARY KEY, awaiting_name INTEGER, record TEXT NOT NULL, last_seen REAL NOT NULL, "
+            "blocked INTEGER NOT NULL DEFAULT 0)"
+        )
+        #Files created before the blocked flag existed get the column added
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(user_memory)")}
+        if 'blocked' not in columns:
+            self._db.execute("ALTER TABLE user_memory ADD COLUMN blocked INTEGER NOT NULL DEFAULT 0")
+        self._db.commit()
+        #Rows queued for the writer by user id (None for a deletion); reads see them before they reach the file
+        self._unwritten = {}
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, args=(db_path,), name='memory-writer', daemon=True)
+        self._writer.start()
+        self.hits = 0
+        self.misses = 0
+        self.rehydrations = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._hot)
+
+    #Return the user's memory, rehydrating it from disk or creating it as needed
+    def get(self, user_id):
+        with self._lock:
+            self._expire_idle()
+            memory = self._hot.get(user_id)
+            if memory is not None:
+                self.hits += 1
+                self._hot.move_to_end(user_id)
+            else:
+                self.misses += 1
+                memory = self._load(user_id)
+                if memory is not None:
+                    self.rehydrations += 1
+                else:
+                    memory = UserMemory(user_id)
+                self._hot[user_id] = memory
+            memory.last_seen = time.time()
+            self._evict_overflow()
+            return memory
+
+    #Start the name flow, forgetting any previous name
+    def set_awaiting_name(self, user_id):
+        memory = self.get(user_id)
+        memory.name = None
+        memory.awaiting_name = True
+        self._persist(memory)
+
+    #Finish the name flow
+    def set_name(self, user_id, name):
+        memory = self.get(user_id)
+        memory.name = name
+        memory.awaiting_name = False
+        self._persist(memory)
+
+    #Record a completed turn in the recent-turn window
+    def add_turn(self, user_id, prompt, response):
+        memory = self.get(user_id)
+        memory.add_turn(prompt, response)
+        self._persist(memory)
+
+    #Replace the running summary once a background summarization completes
+    def set_summary(self, user_id, summary):
+        memory = self.get(user_id)
+        memory.summary = summary
+        self._persist(memory)
+
+    #Mark a user who blocked the bot (or unmark them once they write again); written immediately so broadcasts skip them for good
+    #Only this flag is written, without loading the user: in webhook mode the check-in runs in one worker for every
+    #user, and a cached copy there would go stale and later be spilled over the newer row of the worker owning the user
+    def set_blocked(self, user_id, blocked=True):
+        with self._lock:
+            memory = self._hot.get(user_id)
+            if memory is not None:
+                memory.blocked = blocked
+            row = self._unwritten.get(user_id)
+            if row is not None:
+                #Keep reads of a spilled but not yet written memory in line with the new flag
+                self._queue_write(user_id, row[:3] + (int(blocked),))
+            self._writes.put((user_id, int(blocked)))
+
+    #Forget the user entirely, in RAM and on disk
+    def delete(self, user_id):
+        with self._lock:
+            self._hot.pop(user_id, None)
+            self._queue_write(user_id, None)
+
+    #Users who finished the name flow and have not blocked the bot, whether they are in RAM or spilled to disk
+    def named_user_ids(self):
+        with self._lock:
+            rows = self._db.execute("SELECT user_id FROM user_memory WHERE awaiting_name = 0 AND blocked = 0").fetchall()
+            user_ids = {user_id for (user_id,) in rows}
+            #Changes not yet written override the file, and memories in RAM override both
+            for user_id, row in self._unwritten.items():
+                if row is not None and row[0] == 0 and not row[3]:
+                    user_ids.add(user_id)
+                else:
+                    user_ids.discard(user_id)
+            for user_id, memory in self._hot.items():
+                if memory.awaiting_name is False and not memory.blocked:
+                    user_ids.add(user_id)
+                else:
+                    user_ids.discard(user_id)
+            return list(user_ids)
+
+    def stats(self):
+        return {
+            'hot_users': len(self._hot),
+            'hits': self.hits,
+            'misses': self.misses,
+            'rehydrations': self.rehydrations,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'unwritten': len(self._unwritten),
+        }
+
+    #Spill every in-RAM memory to disk and wait until the writer has committed it, e.g. on shutdown
+    def flush(self):
+        with self._lock:
+            for memory in self._hot.values():
+                self._spill(memory)
+        self._writes.join()
+
+    def _load(self, user_id):
+        if user_id in self._unwritten:
+            row = self._unwritten[user_id]
+            if row is None:
+                return None
+            _, record, last_seen, blocked = row
+            return UserMemory.from_record(user_id, record, last_seen, blocked)
+        row = self._db.execute("SELECT record, last_seen, blocked FROM user_memory WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        return UserMemory.from_record(user_id, row[0], row[1], row[2])
+
+    def _persist(self, memory):
+        if self.write_through:
+            with self._lock:
+                self._spill(memory)
+
+    def _spill(self, memory):
+        awaiting_name = None if memory.awaiting_name is None else int(memory.awaiting_name)
+        self._queue_write(memory.user_id, (awaiting_name, memory.to_record(), memory.last_seen, int(memory.blocked)))
+
+    #Called with the lock held, so the writer applies changes in the order they were made
+    def _queue_write(self, user_id, row):
+        self._unwritten[user_id] = row
+        self._writes.put((user_id, row))
+
+    #The single writer: applies everything queued so far in one transaction, on its own connection
+    def _write_loop(self, db_path):
+        db = sqlite3.connect(db_path, timeout=30)
+        while True:
+            batch = [self._writes.get()]
+            while True:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                for user_id, row in batch:
+                    if row is None:
+                        db.execute("DELETE FROM user_memory WHERE user_id = ?", (user_id,))
+                    elif isinstance(row, int):
+                        db.execute("UPDATE user_memory SET blocked = ? WHERE user_id = ? AND blocked != ?", (row, user_id, row))
+                    else:
+                        #The blocked flag of an existing row only changes through set_blocked, so a memory cached
+                        #in another process never resets it
+                        db.execute(
+                            "INSERT INTO user_memory (user_id, awaiting_name, record, last_seen, blocked) VALUES (?, ?, ?, ?, ?) "
+                            "ON CONFLICT (user_id) DO UPDATE SET awaiting_name = excluded.awaiting_name, record = excluded.record, "
+                            "last_seen = excluded.last_seen",
+                            (user_id,) + row
+                        )
+                db.commit()
+                written = True
+            except sqlite3.Error as e:
+                db.rollback()
+                #Failed rows stay readable from RAM in this process
+                logger.error(f"Writing {len(batch)} memory changes failed: {e}")
+                written = False
+            with self._lock:
+                for user_id, row in batch:
+                    #Flag updates (ints) are never held in _unwritten
+                    if written and not isinstance(row, int) and self._unwritten.get(user_id, False) is row:
+                        del self._unwritten[user_id]
+            for _ in batch:
+                self._writes.task_done()
+
+    #Least recently used entries sit at the front, so idle ones are found without a full scan
+    def _expire_idle(self):
+        cutoff = time.time() - self.idle_ttl
+        while self._hot:
+            memory = next(iter(self._hot.values()))
+            if memory.last_seen > cutoff:
+                break
+            self._hot.popitem(last=False)
+            self._spill(memory)
+            self.expirations += 1
+
+    def _evict_overflow(self):
+        while len(self._hot) > self.max_users:
+            _, memory = self._hot.popitem(last=False)
+            self._spill(memory)
+            self.evictions += 1
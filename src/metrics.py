@@ -0,0 +1,245 @@
+import os
+import hmac
+import json
+import time
+import asyncio
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Metrics endpoint port (0 disables it) and interval of the periodic structured log dump (0 disables it)
+metrics_port = int(os.getenv('METRICS_PORT', '0'))
+#The endpoint is internal: it listens on localhost unless configured otherwise, and can require a bearer token
+metrics_host = os.getenv('METRICS_HOST', '127.0.0.1')
+metrics_token = os.getenv('METRICS_TOKEN')
+metrics_dump_interval = float(os.getenv('METRICS_DUMP_INTERVAL', '0'))
+
+#Latency buckets in seconds, from fast in-process stages to slow LLM calls and broadcasts
+default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+#Base for labelled metrics; values are kept per sorted label tuple
+class Metric:
+    kind = None
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels):
+        return tuple(sorted(labels.items()))
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets=default_buckets):
+        super().__init__(name, description)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    samples.append((f"{self.name}_bucket", key + (('le', repr(float(bound))),), bucket_count))
+                samples.append((f"{self.name}_bucket", key + (('le', '+Inf'),), count))
+                samples.append((f"{self.name}_sum", key, total))
+                samples.append((f"{self.name}_count", key, count))
+        return samples
+
+
+#All metrics of the process plus collectors that report gauges owned by other components
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, description):
+        return self._add(Counter(name, description))
+
+    def gauge(self, name, description):
+        return self._add(Gauge(name, description))
+
+    def histogram(self, name, description, buckets=default_buckets):
+        return self._add(Histogram(name, description, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    #collector() returns a dict of {metric name: value} or {metric name: {label value: value}}, read at scrape time
+    def register_collector(self, prefix, collector, label='key'):
+        self.collectors.append((prefix, collector, label))
+
+    def _collected(self):
+        lines = []
+        for prefix, collector, label in self.collectors:
+            try:
+                values = collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector {prefix} failed: {e}")
+                continue
+            for name, value in values.items():
+                if isinstance(value, dict):
+                    for label_value, item in value.items():
+                        if isinstance(item, (int, float)):
+                            lines.append((f"{prefix}_{name}", ((label, label_value),), item))
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append((f"{prefix}_{name}", (), value))
+        return lines
+
+    #Prometheus text exposition format
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        for name, labels, value in self._collected():
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    #Compact structured snapshot for the periodic log dump
+    def snapshot(self):
+        data = {}
+        for metric in self.metrics:
+            for name, labels, value in metric.samples():
+                if name.endswith('_bucket'):
+                    continue
+                data[name + format_labels(labels)] = round(value, 6) if isinstance(value, float) else value
+        for name, labels, value in self._collected():
+            data[name + format_labels(labels)] = value
+        return data
+
+
+registry = Registry()
+
+#Pipeline metrics shared by the whole bot
+stage_seconds = registry.histogram('mentaai_stage_seconds', "Duration of message pipeline stages")
+stage_outcomes = registry.counter('mentaai_stage_outcomes_total', "Pipeline stage results by outcome (ok, timeout, error)")
+handler_seconds = registry.histogram('mentaai_handler_seconds', "Duration of Telegram handlers and scheduled jobs")
+handler_errors = registry.counter('mentaai_handler_errors_total', "Handlers that raised an exception")
+handlers_in_flight = registry.gauge('mentaai_handlers_in_flight', "Handlers currently running")
+llm_tokens = registry.counter('mentaai_llm_tokens_total', "Tokens used by LLM calls")
+prompt_tokens = registry.counter('mentaai_prompt_tokens_total', "Tokens of the budgeted prompt sections, kept or trimmed")
+first_text_seconds = registry.histogram('mentaai_first_text_seconds', "Time until the first reply text is visible to the user")
+
+
+#Time a block of code as one pipeline stage
+@contextmanager
+def stage_timer(stage):
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except Exception:
+        outcome = 'error'
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage)
+        stage_outcomes.inc(stage=stage, outcome=outcome)
+
+
+#Decorator recording duration, errors and concurrency of an async handler
+def instrument_handler(name):
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            handlers_in_flight.inc(handler=name)
+            try:
+                return await handler(*args, **kwargs)
+            except Exception:
+                handler_errors.inc(handler=name)
+                raise
+            finally:
+                handlers_in_flight.dec(handler=name)
+                handler_seconds.observe(time.perf_counter() - start, handler=name)
+        return wrapper
+    return decorator
+
+
+async def handle_metrics_request(headers, body):
+    if metrics_token and not hmac.compare_digest(headers.get('authorization', ''), f"Bearer {metrics_token}"):
+        return 401, 'text/plain', b'Unauthorized'
+    return 200, 'text/plain; version=0.0.4', registry.render().encode('utf-8')
+
+
+#Serve /metrics on METRICS_HOST and the given port (if non-zero) and start the periodic dump (if configured)
+async def start_metrics(port=None):
+    from http_server import serve_http
+    port = metrics_port if port is None else port
+    server = None
+    if port:
+        server = await serve_http(metrics_host, port, {('GET', '/metrics'): handle_metrics_request})
+        logger.info(f"Metrics endpoint listening on {metrics_host}:{port}")
+    if metrics_dump_interval > 0:
+        asyncio.get_running_loop().create_task(dump_periodically(metrics_dump_interval))
+    return server
+
+
+async def dump_periodically(interval):
+    while True:
+        await asyncio.sleep(interval)
+        logger.info(f"Metrics: {json.dumps(registry.snapshot(), sort_keys=True)}")
@@ -1,15 +1,27 @@
 import os
-from transformers import pipeline
 from langchain.schema import SystemMessage
-from langchain_openai import ChatOpenAI
-from proxy_setup import create_http_client_with_proxy
+from langchain_core.callbacks import BaseCallbackHandler
+from http_transport import create_timeout, shared_async_client, shared_sync_client
+from batching import MicroBatcher
+from inference_backends import load_text_classifier, emotion_model_name
+from warmup import LazyResource
+from metrics import llm_tokens
 from dotenv import load_dotenv
 
 #Load environment variables
 load_dotenv()
 
 #Initialize an emotion recognition model to detect specific emotions from user input
-emotion_classifier = pipeline("text-classification", model="j-hartmann/emotion-english-distilroberta-base", top_k=None)
+#Runs on the backend chosen by INFERENCE_BACKEND / EMOTION_INFERENCE_BACKEND (fp32 torch, int8 quantized or ONNX)
+def load_emotion_classifier():
+    return load_text_classifier(emotion_model_name)
+
+#Loaded on first use or by the startup warm-up, not at import time
+emotion_classifier = LazyResource('emotion_classifier', load_emotion_classifier)
+
+#Batch concurrent emotion requests into a single forward pass; returns all label scores per input
+#Telegram messages can be longer than the model's 512 tokens, so inputs are truncated rather than failing the batch
+emotion_batcher = MicroBatcher('emotion_classifier', lambda texts: emotion_classifier.get()(texts, batch_size=len(texts), truncation=True))
 
 #Define the system message that instructs the bot's behavior during conversations
 client_manager_system_message = SystemMessage(
@@ -39,12 +51,39 @@ client_manager_system_message = SystemMessage(
     )
 )
 
-#Create the HTTP client with proxy configuration
-http_client = create_http_client_with_proxy()
-
 #Initialize OpenAI API client using LangChain with the configured HTTP client
 openai_api_key = os.getenv('OPENAI_API_KEY')
 if not openai_api_key:
     raise ValueError("No OPENAI_API_KEY found in environment variables")
 
-llm = ChatOpenAI(api_key=openai_api_key, model='gpt-4o', http_client=http_client, temperature=0.65)
\ No newline at end of file
+#Count the tokens of every completed LLM call, from the API's usage report (also sent at the end of a stream)
+class TokenUsageCallback(BaseCallbackHandler):
+    def __init__(self, purpose):
+        self.purpose = purpose
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get('token_usage') or {}
+        input_tokens = usage.get('prompt_tokens', 0)
+        output_tokens = usage.get('completion_tokens', 0)
+        if not usage:
+            for generations in response.generations:
+                for generation in generations:
+                    metadata = getattr(getattr(generation, 'message', None), 'usage_metadata', None) or {}
+                    input_tokens += metadata.get('input_tokens', 0)
+                    output_tokens += metadata.get('output_tokens', 0)
+        llm_tokens.inc(input_tokens, purpose=self.purpose, direction='input')
+        llm_tokens.inc(output_tokens, purpose=self.purpose, direction='output')
+
+def create_chat_model(temperature, purpose):
+    from langchain_openai import ChatOpenAI
+    #All clients share one pooled connection to the API; retries and backoff happen in the shared transport
+    #The timeout must be passed here too: the OpenAI SDK sends ChatOpenAI's default (None, no timeout) with every request,
+    #which would replace the shared client's timeouts
+    return ChatOpenAI(api_key=openai_api_key, model='gpt-4o', http_client=shared_sync_client, http_async_client=shared_async_client,
+                      timeout=create_timeout(), max_retries=0, temperature=temperature, stream_usage=True,
+                      callbacks=[TokenUsageCallback(purpose)])
+
+llm = LazyResource('llm', lambda: create_chat_model(0.65, 'reply'))
+
+#Single lower-temperature client shared by every user's conversation summary
+summary_llm = LazyResource('summary_llm', lambda: create_chat_model(0.3, 'summary'))
@@ -0,0 +1,130 @@
+import os
+import logging
+from warmup import LazyResource
+from metrics import prompt_tokens
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Token budgets of the dynamic prompt sections; the static system prompt is not budgeted
+summary_token_budget = int(os.getenv('PROMPT_SUMMARY_TOKENS', '300'))
+recent_turns_token_budget = int(os.getenv('PROMPT_RECENT_TURNS_TOKENS', '600'))
+retrieved_token_budget = int(os.getenv('PROMPT_RETRIEVED_TOKENS', '500'))
+
+#Tokenizer of the chat model (o200k_base for gpt-4o)
+token_encoding_name = os.getenv('PROMPT_TOKEN_ENCODING', 'o200k_base')
+
+#Without tiktoken, tokens are estimated at about four characters each
+chars_per_token = 4
+
+#Marks text cut by a budget
+ellipsis = "..."
+
+
+#tiktoken downloads its vocabulary on first use; if it is missing or offline, token counts are estimated instead
+def load_token_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(token_encoding_name)
+    except Exception as e:
+        logger.warning(f"tiktoken encoding '{token_encoding_name}' unavailable, estimating tokens from characters: {e}")
+        return None
+
+token_encoding = LazyResource('token_encoding', load_token_encoding)
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoding = token_encoding.get()
+    if encoding is None:
+        return (len(text) + chars_per_token - 1) // chars_per_token
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+#Cut text to at most max_tokens, keeping its start (or its end with keep_end=True); the same input always gives the same output
+def truncate_tokens(text, max_tokens, keep_end=False):
+    if count_tokens(text) <= max_tokens:
+        return text
+    #One token of the budget goes to the ellipsis marking the cut
+    max_tokens = max(0, max_tokens - 1)
+    encoding = token_encoding.get()
+    if encoding is None:
+        limit = max_tokens * chars_per_token
+        kept = text[len(text) - limit:] if keep_end else text[:limit]
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        kept = encoding.decode(tokens[len(tokens) - max_tokens:] if keep_end else tokens[:max_tokens])
+    if not kept:
+        return ""
+    return ellipsis + kept if keep_end else kept + ellipsis
+
+
+#The running summary grows at its end, so when it is too long its oldest part is dropped
+def fit_summary(summary, budget=None):
+    budget = summary_token_budget if budget is None else budget
+    return truncate_tokens(summary or "", budget, keep_end=True)
+
+
+#Keep the newest turns that fit; format_turns renders a list of (input, output) pairs
+def fit_turns(turns, format_turns, budget=None):
+    budget = recent_turns_token_budget if budget is None else budget
+    kept = []
+    used = 0
+    for turn in reversed(turns):
+        cost = count_tokens(format_turns([turn]))
+        if used + cost > budget:
+            break
+        kept.insert(0, turn)
+        used += cost
+    if kept or not turns:
+        return format_turns(kept)
+    #Even the newest turn is over budget: keep its end, which holds the reply the user is answering
+    return truncate_tokens(format_turns(turns[-1:]), budget, keep_end=True)
+
+
+#Keep the best-ranked examples that fit; format_examples renders a list of example dicts (header included)
+def fit_examples(examples, format_examples, budget=None):
+    budget = retrieved_token_budget if budget is None else budget
+    if not examples:
+        return ""
+    kept = []
+    for example in examples:
+        if count_tokens(format_examples(kept + [example])) > budget:
+            break
+        kept.append(example)
+    if kept:
+        return format_examples(kept)
+    #Even the best example is over budget: shorten its counselor reply to what is left
+    best = dict(examples[0])
+    remaining = budget - count_tokens(format_examples([dict(best, counselor="")]))
+    best['counselor'] = truncate_tokens(best['counselor'], max(0, remaining))
+    return format_examples([best]) if best['counselor'] else ""
+
+
+#Budget the dynamic sections of one prompt; returns memory_context, retrieved_context and a token report
+def build_sections(summary, turns, examples, format_turns, format_examples):
+    summary_text = fit_summary(summary)
+    turns_text = fit_turns(turns, format_turns)
+    retrieved_context = fit_examples(examples, format_examples)
+    memory_context = f"Summary:\n{summary_text}\n\nRecent Interactions:\n{turns_text}"
+
+    report = {}
+    for section, original, kept in (
+        ('summary', summary or "", summary_text),
+        ('recent_turns', format_turns(turns), turns_text),
+        ('retrieved', format_examples(examples) if examples else "", retrieved_context),
+    ):
+        original_tokens = count_tokens(original)
+        kept_tokens = count_tokens(kept)
+        saved = max(0, original_tokens - kept_tokens)
+        prompt_tokens.inc(kept_tokens, section=section, kind='kept')
+        prompt_tokens.inc(saved, section=section, kind='trimmed')
+        report[section] = {'tokens': kept_tokens, 'saved': saved}
+    report['tokens'] = sum(report[section]['tokens'] for section in ('summary', 'recent_turns', 'retrieved'))
+    report['saved'] = sum(report[section]['saved'] for section in ('summary', 'recent_turns', 'retrieved'))
+    return memory_context, retrieved_context, report
@@ -0,0 +1,166 @@
+import os
+import logging
+import numpy as np
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Index configuration
+index_backend = os.getenv('RETRIEVAL_INDEX', 'brute_force')
+ivf_nlist = int(os.getenv('IVF_NLIST', '0'))  #0 picks roughly sqrt(N) lists
+ivf_nprobe = int(os.getenv('IVF_NPROBE', '8'))
+hnsw_m = int(os.getenv('HNSW_M', '16'))
+hnsw_ef = int(os.getenv('HNSW_EF', '64'))
+
+
+#Normalize rows (or a single vector) to unit length so a dot product equals cosine similarity
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+#Pick the k highest scores, ordered from best to worst
+def top_k(scores, k):
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    indices = np.argpartition(-scores, k - 1)[:k]
+    indices = indices[np.argsort(-scores[indices], kind='stable')]
+    return indices, scores[indices]
+
+
+#Exact cosine search over the raw (possibly memory-mapped) matrix; the reference for every other backend
+class BruteForceIndex:
+    name = 'brute_force'
+
+    #Number of stored embeddings scored at once, bounding the temporary float32 copy
+    chunk_size = 65536
+
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def similarities(self, query):
+        query = normalize(query)
+        scores = np.empty(self.matrix.shape[0], dtype=np.float32)
+        for start in range(0, self.matrix.shape[0], self.chunk_size):
+            block = np.asarray(self.matrix[start:start + self.chunk_size], dtype=np.float32)
+            norms = np.maximum(np.linalg.norm(block, axis=1), 1e-12)
+            scores[start:start + len(block)] = (block @ query) / norms
+        return scores
+
+    def search(self, query, k):
+        return top_k(self.similarities(query), k)
+
+
+#Exact search on a matrix normalized once at build time, leaving a single matrix-vector product per query
+class NormalizedDotIndex:
+    name = 'normalized_dot'
+
+    def __init__(self, matrix):
+        self.matrix = np.ascontiguousarray(normalize(matrix))
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def search(self, query, k):
+        return top_k(self.matrix @ normalize(query), k)
+
+
+#Inverted-file index: k-means partitions the corpus and queries only scan the nprobe closest lists
+class IVFIndex:
+    name = 'ivf'
+
+    def __init__(self, matrix, nlist=0, nprobe=8, iterations=10, sample_size=100000, seed=0):
+        self.matrix = np.ascontiguousarray(normalize(matrix))
+        count = self.matrix.shape[0]
+        self.nlist = max(1, min(count, nlist or int(np.sqrt(count))))
+        self.nprobe = max(1, min(self.nlist, nprobe))
+
+        #Train spherical k-means on a sample of the corpus
+        rng = np.random.default_rng(seed)
+        sample = self.matrix[rng.choice(count, size=min(count, sample_size), replace=False)] if count else self.matrix
+        self.centroids = sample[rng.choice(len(sample), size=self.nlist, replace=False)] if count else sample
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ self.centroids.T, axis=1)
+            for list_id in range(self.nlist):
+                members = sample[assignment == list_id]
+                if len(members):
+                    self.centroids[list_id] = members.mean(axis=0)
+            self.centroids = normalize(self.centroids)
+
+        #Assign every vector to its closest centroid, processing the corpus in chunks
+        assignment = np.empty(count, dtype=np.int64)
+        for start in range(0, count, 65536):
+            assignment[start:start + 65536] = np.argmax(self.matrix[start:start + 65536] @ self.centroids.T, axis=1)
+        order = np.argsort(assignment, kind='stable')
+        boundaries = np.searchsorted(assignment[order], np.arange(self.nlist + 1))
+        self.lists = [order[boundaries[i]:boundaries[i + 1]] for i in range(self.nlist)]
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def search(self, query, k):
+        query = normalize(query)
+        probed, _ = top_k(self.centroids @ query, self.nprobe)
+        candidates = np.concatenate([self.lists[list_id] for list_id in probed]) if len(probed) else np.empty(0, dtype=np.int64)
+        positions, scores = top_k(self.matrix[candidates] @ query, k)
+        return candidates[positions], scores
+
+
+#Graph-based approximate search backed by the optional hnswlib package
+class HNSWIndex:
+    name = 'hnsw'
+
+    def __init__(self, matrix, m=16, ef=64):
+        try:
+            import hnswlib
+        except ImportError:
+            raise ValueError("The 'hnsw' retrieval index requires the hnswlib package (pip install hnswlib)")
+        vectors = normalize(matrix)
+        self.count = vectors.shape[0]
+        self.index = hnswlib.Index(space='ip', dim=vectors.shape[1])
+        self.index.init_index(max_elements=max(1, self.count), M=m, ef_construction=max(ef, 100))
+        if self.count:
+            self.index.add_items(vectors, np.arange(self.count))
+        self.index.set_ef(ef)
+
+    def __len__(self):
+        return self.count
+
+    def search(self, query, k):
+        k = min(k, self.count)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        labels, distances = self.index.knn_query(normalize(query), k=k)
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+
+index_backends = {
+    BruteForceIndex.name: BruteForceIndex,
+    NormalizedDotIndex.name: NormalizedDotIndex,
+    IVFIndex.name: IVFIndex,
+    HNSWIndex.name: HNSWIndex,
+}
+
+
+#Build the configured index backend over the embedding matrix
+def build_index(matrix, backend=None):
+    backend = backend or index_backend
+    if backend not in index_backends:
+        raise ValueError(f"Unknown retrieval index '{backend}', expected one of: {', '.join(index_backends)}")
+    if backend == IVFIndex.name:
+        index = IVFIndex(matrix, nlist=ivf_nlist, nprobe=ivf_nprobe)
+    elif backend == HNSWIndex.name:
+        index = HNSWIndex(matrix, m=hnsw_m, ef=hnsw_ef)
+    else:
+        index = index_backends[backend](matrix)
+    logger.info(f"Built '{backend}' retrieval index over {len(index)} embeddings")
+    return index
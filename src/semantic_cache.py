@@ -0,0 +1,114 @@
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Cache sizes and the cosine similarity above which a previous query's results are reused
+retrieval_cache_size = int(os.getenv('RETRIEVAL_CACHE_SIZE', '4096'))
+retrieval_cache_similar_size = int(os.getenv('RETRIEVAL_CACHE_SIMILAR_SIZE', '1024'))
+retrieval_cache_similarity = float(os.getenv('RETRIEVAL_CACHE_SIMILARITY', '0.95'))
+
+#Retrieval result for one query: its embedding and the top-k corpus indices with their scores
+CachedRetrieval = namedtuple('CachedRetrieval', ['embedding', 'indices', 'scores'])
+
+whitespace_pattern = re.compile(r"\s+")
+
+
+#Prompts differing only in case, spacing or trailing punctuation share an exact-match entry
+def normalize_prompt(prompt):
+    return whitespace_pattern.sub(" ", prompt.casefold()).strip(" .!?")
+
+
+#Two-tier retrieval cache, invalidated whenever the embedding corpus version changes:
+#an exact LRU keyed on the normalized prompt (skips encoding and search) and a
+#similarity tier over recent query embeddings (skips the corpus search for near-duplicates)
+class SemanticCache:
+    def __init__(self, max_entries=None, max_similar_entries=None, similarity_threshold=None):
+        self.max_entries = max_entries or retrieval_cache_size
+        self.max_similar_entries = max_similar_entries or retrieval_cache_similar_size
+        self.similarity_threshold = similarity_threshold or retrieval_cache_similarity
+        self._lock = threading.Lock()
+        self.version = None
+        self._clear()
+
+    def _clear(self):
+        self._exact = OrderedDict()
+        self._similar_matrix = None
+        self._similar_entries = [None] * self.max_similar_entries
+        self._similar_next = 0
+        self._similar_count = 0
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    #Drop every entry if the corpus the results refer to has changed
+    def _check_version(self, version):
+        if version != self.version:
+            self._clear()
+            self.version = version
+
+    def get_exact(self, prompt, version):
+        key = normalize_prompt(prompt)
+        with self._lock:
+            self._check_version(version)
+            entry = self._exact.get(key)
+            if entry is not None:
+                self._exact.move_to_end(key)
+                self.exact_hits += 1
+            return entry
+
+    #Results of the most similar recent query, if it is close enough to reuse
+    def get_similar(self, embedding, version):
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        with self._lock:
+            self._check_version(version)
+            if self._similar_count:
+                similarities = self._similar_matrix[:self._similar_count] @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    self.similar_hits += 1
+                    return self._similar_entries[best]
+            self.misses += 1
+            return None
+
+    def put(self, prompt, embedding, indices, scores, version):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        entry = CachedRetrieval(embedding, np.asarray(indices), np.asarray(scores))
+        with self._lock:
+            self._check_version(version)
+            if prompt is not None:
+                key = normalize_prompt(prompt)
+                self._exact[key] = entry
+                self._exact.move_to_end(key)
+                while len(self._exact) > self.max_entries:
+                    self._exact.popitem(last=False)
+                    self.evictions += 1
+
+            #The similarity tier is a ring buffer of normalized embeddings; the oldest entry is overwritten
+            if self._similar_matrix is None:
+                self._similar_matrix = np.zeros((self.max_similar_entries, embedding.shape[-1]), dtype=np.float32)
+            slot = self._similar_next
+            self._similar_matrix[slot] = embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+            self._similar_entries[slot] = entry
+            self._similar_next = (slot + 1) % self.max_similar_entries
+            self._similar_count = min(self._similar_count + 1, self.max_similar_entries)
+
+    def stats(self):
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            'version': self.version,
+            'exact_entries': len(self._exact),
+            'similar_entries': self._similar_count,
+            'exact_hits': self.exact_hits,
+            'similar_hits': self.similar_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round((self.exact_hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,144 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from telegram.constants import ChatAction, MessageLimit
+from telegram.error import BadRequest, RetryAfter, TelegramError
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Streaming configuration: replies are edited in place at most once per interval (Telegram limits edits per chat)
+stream_replies = os.getenv('STREAM_REPLIES', '1') == '1'
+stream_edit_interval = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
+stream_min_first_chars = int(os.getenv('STREAM_MIN_FIRST_CHARS', '20'))
+
+#The typing indicator expires after about five seconds, so it is refreshed until the first text is visible
+typing_refresh_seconds = 4
+
+#End of a sentence: punctuation followed by whitespace, or a line break
+sentence_end_pattern = re.compile(r"[.!?…][\"')\]]*\s|\n")
+
+
+#Shows an LLM reply in Telegram while it is being generated: typing indicator, first sentence, then throttled edits
+class StreamingReply:
+    def __init__(self, bot, chat_id, edit_interval=None, min_first_chars=None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.edit_interval = stream_edit_interval if edit_interval is None else edit_interval
+        self.min_first_chars = stream_min_first_chars if min_first_chars is None else min_first_chars
+        self.text = ""
+        self._offset = 0
+        self._message = None
+        self._shown = ""
+        self._next_edit = 0.0
+        self._typing_task = None
+        self.started = time.monotonic()
+        self.first_visible_seconds = None
+
+    #Show the typing indicator right away and keep it alive until text appears
+    async def start(self):
+        await self._send_typing()
+        self._typing_task = asyncio.get_running_loop().create_task(self._keep_typing())
+
+    async def _send_typing(self):
+        try:
+            await self.bot.send_chat_action(chat_id=self.chat_id, action=ChatAction.TYPING)
+        except Exception as e:
+            logger.warning(f"Could not send typing action to chat {self.chat_id}: {e}")
+
+    async def _keep_typing(self):
+        while self._message is None:
+            await asyncio.sleep(typing_refresh_seconds)
+            if self._message is None:
+                await self._send_typing()
+
+    def _stop_typing(self):
+        if self._typing_task is not None:
+            self._typing_task.cancel()
+            self._typing_task = None
+
+    #Add a streamed chunk; sends the first sentence as soon as it is complete, then edits on a throttled cadence
+    async def feed(self, chunk):
+        self.text += chunk
+        await self._split_overflow()
+        current = self.text[self._offset:]
+        if self._message is None:
+            if len(current.strip()) >= self.min_first_chars and sentence_end_pattern.search(current):
+                await self._send(current)
+        elif time.monotonic() >= self._next_edit:
+            await self._edit(current)
+
+    #Show the complete reply
+    async def finish(self):
+        self._stop_typing()
+        await self._split_overflow()
+        current = self.text[self._offset:]
+        if self._message is None:
+            if current.strip():
+                await self._send(current)
+        elif current != self._shown:
+            #The final edit must land, so wait out the edit throttle instead of skipping it
+            delay = self._next_edit - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await self._edit(current, final=True)
+
+    #Stop the typing indicator without sending anything, e.g. after an error
+    def cancel(self):
+        self._stop_typing()
+
+    #Telegram messages are limited in length; complete the current message and continue in a new one
+    async def _split_overflow(self):
+        limit = MessageLimit.MAX_TEXT_LENGTH
+        while len(self.text) - self._offset > limit:
+            current = self.text[self._offset:self._offset + limit]
+            cut = current.rfind(" ") if " " in current[limit // 2:] else limit
+            head = current[:cut]
+            if self._message is None:
+                await self._send(head)
+            elif head != self._shown:
+                await self._edit(head, final=True)
+            self._offset += cut
+            self._message = None
+            self._shown = ""
+
+    async def _send(self, text):
+        self._message = await self.bot.send_message(chat_id=self.chat_id, text=text)
+        self._shown = text
+        self._next_edit = time.monotonic() + self.edit_interval
+        if self.first_visible_seconds is None:
+            self.first_visible_seconds = time.monotonic() - self.started
+            self._stop_typing()
+
+    async def _edit(self, text, final=False):
+        try:
+            await self.bot.edit_message_text(chat_id=self.chat_id, message_id=self._message.message_id, text=text)
+            self._shown = text
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, 'total_seconds') else float(e.retry_after)
+            self._next_edit = time.monotonic() + retry_after
+            if final:
+                await asyncio.sleep(retry_after)
+                await self._edit(text, final=True)
+            return
+        except TelegramError as e:
+            #Editing to identical text is rejected by Telegram and is harmless
+            if not (isinstance(e, BadRequest) and 'not modified' in str(e).lower()):
+                #A failed edit must not end the reply; the next edit or the final text catches up
+                logger.warning(f"Could not edit streamed reply in chat {self.chat_id}: {e}")
+                if final:
+                    await self._send_rest(text)
+                    return
+        self._next_edit = time.monotonic() + self.edit_interval
+
+    #The final edit failed, so send the text the user has not seen yet as a new message
+    async def _send_rest(self, text):
+        rest = text[len(self._shown):] if text.startswith(self._shown) else text
+        if rest.strip():
+            await self._send(rest)
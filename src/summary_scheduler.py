@@ -0,0 +1,99 @@
+import os
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Summarize after this many buffered turns (at most the recent-turn window, so no turn drops out of context unsummarized),
+#or after this many idle seconds since the user's last turn
+summary_every_n_turns = int(os.getenv('SUMMARY_EVERY_N_TURNS', '3'))
+summary_idle_seconds = float(os.getenv('SUMMARY_IDLE_SECONDS', '300'))
+
+
+#Buffers conversation turns per user and folds them into the running summary in the background
+#summarize is a coroutine function called as summarize(user_id, turns) with a list of (input, output) pairs
+class SummaryScheduler:
+    def __init__(self, summarize, every_n_turns=None, idle_seconds=None):
+        self.summarize = summarize
+        self.every_n_turns = every_n_turns or summary_every_n_turns
+        self.idle_seconds = summary_idle_seconds if idle_seconds is None else idle_seconds
+        self._pending = {}
+        self._idle_timers = {}
+        self._running = {}
+
+    #Buffer one completed turn; never waits for the summarization itself
+    def add_turn(self, user_id, prompt, response):
+        self._pending.setdefault(user_id, []).append((prompt, response))
+        if len(self._pending[user_id]) >= self.every_n_turns:
+            self._start(user_id)
+        else:
+            self._reset_idle_timer(user_id)
+
+    def pending_turns(self, user_id):
+        return list(self._pending.get(user_id, []))
+
+    def stats(self):
+        return {
+            'pending_users': len(self._pending),
+            'pending_turns': sum(len(turns) for turns in self._pending.values()),
+            'running': len(self._running),
+        }
+
+    def _reset_idle_timer(self, user_id):
+        timer = self._idle_timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._idle_timers[user_id] = loop.call_later(self.idle_seconds, self._start, user_id)
+
+    def _start(self, user_id):
+        timer = self._idle_timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+        #A running summarization picks up turns added meanwhile, so updates are coalesced per user
+        if user_id in self._running or not self._pending.get(user_id):
+            return
+        self._running[user_id] = asyncio.get_running_loop().create_task(self._run(user_id))
+
+    async def _run(self, user_id):
+        current_task = asyncio.current_task()
+        try:
+            while self._pending.get(user_id):
+                turns = self._pending.pop(user_id)
+                try:
+                    await self.summarize(user_id, turns)
+                except Exception as e:
+                    #Keep the turns so the next trigger retries them
+                    self._pending[user_id] = turns + self._pending.get(user_id, [])
+                    logger.error(f"Error summarizing conversation for user {user_id}: {e}")
+                    break
+                if len(self._pending.get(user_id, [])) < self.every_n_turns:
+                    break
+        finally:
+            #After discard() a newer task may already run for this user; only remove our own entry
+            if self._running.get(user_id) is current_task:
+                del self._running[user_id]
+        if self._pending.get(user_id):
+            self._reset_idle_timer(user_id)
+
+    #Forget everything buffered for a user, e.g. after /restart
+    def discard(self, user_id):
+        self._pending.pop(user_id, None)
+        timer = self._idle_timers.pop(user_id, None)
+        if timer is not None:
+            timer.cancel()
+        task = self._running.pop(user_id, None)
+        if task is not None:
+            task.cancel()
+
+    #Summarize every buffered turn now and wait for completion, e.g. before shutdown
+    async def flush(self):
+        for user_id in list(self._pending):
+            self._start(user_id)
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
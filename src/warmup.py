@@ -0,0 +1,122 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logger = logging.getLogger(__name__)
+
+#Threads used to load heavy components in parallel at startup
+warmup_workers = int(os.getenv('WARMUP_WORKERS', '4'))
+
+#Every lazily loaded component, in declaration order
+registry = []
+
+#Set once the startup warm-up has finished (successfully or not)
+ready_event = threading.Event()
+
+#One asyncio event per waiting event loop, set from the warm-up thread when it finishes
+ready_waiters = {}
+ready_waiters_lock = threading.Lock()
+
+#Per-component load times (or errors) from the last warm-up
+warmup_report = {}
+
+
+#A heavy component created on first use instead of at import time; safe to use from several threads
+class LazyResource:
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.load_seconds = None
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def get(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    start = time.perf_counter()
+                    self._value = self.factory()
+                    self.load_seconds = time.perf_counter() - start
+                    self._loaded = True
+                    logger.info(f"Loaded {self.name} in {self.load_seconds:.2f}s")
+        return self._value
+
+    #Replace the value, e.g. after a reload or with a stand-in for benchmarks
+    def set(self, value):
+        with self._lock:
+            self._value = value
+            self._loaded = True
+
+    def is_loaded(self):
+        return self._loaded
+
+
+#Load every registered component in parallel threads and log how long each took
+def warm_up(resources=None):
+    resources = registry if resources is None else resources
+    start = time.perf_counter()
+
+    def load(resource):
+        try:
+            resource.get()
+            return resource.name, round(resource.load_seconds or 0.0, 3)
+        except Exception as e:
+            logger.error(f"Warm-up of {resource.name} failed: {e}")
+            return resource.name, f"failed: {e}"
+
+    with ThreadPoolExecutor(max_workers=max(1, warmup_workers), thread_name_prefix='warmup') as executor:
+        warmup_report.update(executor.map(load, resources))
+    warmup_report['total'] = round(time.perf_counter() - start, 3)
+
+    ready_event.set()
+    notify_ready_waiters()
+    logger.info(f"Warm-up finished: {warmup_report}")
+    return warmup_report
+
+
+#Run the warm-up in the background so cheap handlers can answer immediately
+def start_warm_up():
+    thread = threading.Thread(target=warm_up, name='warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def is_ready():
+    return ready_event.is_set()
+
+
+def notify_ready_waiters():
+    with ready_waiters_lock:
+        waiters = list(ready_waiters.items())
+        ready_waiters.clear()
+    for loop, event in waiters:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            #The loop was closed while waiting
+            pass
+
+
+#Wait (without blocking the event loop or an executor thread) until the warm-up has finished; returns False on timeout
+async def wait_until_ready(timeout):
+    loop = asyncio.get_running_loop()
+    with ready_waiters_lock:
+        #Checked under the lock so a warm-up finishing right now cannot be missed
+        if ready_event.is_set():
+            return True
+        event = ready_waiters.setdefault(loop, asyncio.Event())
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
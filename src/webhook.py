@@ -0,0 +1,273 @@
+import os
+import json
+import signal
+import asyncio
+import logging
+import multiprocessing
+from http_server import serve_http
+from metrics import registry, metrics_port, start_metrics
+from dotenv import load_dotenv
+
+#Webhook deployment: a light front process receives Telegram updates over HTTP and routes each one,
+#by user id, to one of N worker processes that run the models and handlers.
+#Usage: python webhook.py  (see the README for the environment variables)
+
+#Load environment variables
+load_dotenv()
+
+#Set up logging to capture information and errors for debugging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+#Webhook configuration
+webhook_listen = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+webhook_port = int(os.getenv('WEBHOOK_PORT', '8443'))
+webhook_path = os.getenv('WEBHOOK_PATH', '/telegram')
+webhook_url = os.getenv('WEBHOOK_URL')  #Public base URL; when set, the webhook is registered with Telegram on startup
+webhook_secret = os.getenv('WEBHOOK_SECRET')
+webhook_workers = int(os.getenv('WEBHOOK_WORKERS', '2'))
+
+#Lock file that elects the single process running the daily check-in scheduler
+scheduler_lock_path = os.getenv('SCHEDULER_LOCK_PATH', 'scheduler.lock')
+scheduler_election_interval = 60
+
+#Seconds between checks for dead workers
+supervise_interval = 5
+
+#Update fields that carry the user who sent them
+user_update_fields = (
+    'message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result',
+    'shipping_query', 'pre_checkout_query', 'poll_answer', 'my_chat_member', 'chat_member', 'chat_join_request',
+)
+
+
+#Find the user (or, failing that, the chat) an update belongs to
+def extract_user_id(update_data):
+    for field in user_update_fields:
+        payload = update_data.get(field)
+        if not isinstance(payload, dict):
+            continue
+        sender = payload.get('from') or payload.get('user')
+        if sender and 'id' in sender:
+            return sender['id']
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat and 'id' in chat:
+            return chat['id']
+    return None
+
+
+#Every update of a user goes to the same worker, so their messages are handled in order
+def shard_for(update_data, workers):
+    user_id = extract_user_id(update_data)
+    if user_id is None:
+        user_id = update_data.get('update_id', 0)
+    return abs(int(user_id)) % workers
+
+
+#Non-blocking exclusive lock on a file; returns the open file while held, None if another process has it
+def try_acquire_lock(path):
+    import fcntl
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+#Keep trying to become the scheduler node; the lock is released automatically if the holder dies
+async def elect_scheduler(application, create_scheduler):
+    while True:
+        lock_file = try_acquire_lock(scheduler_lock_path)
+        if lock_file is not None:
+            logger.info(f"Process {os.getpid()} acquired the scheduler lock and runs the daily check-ins")
+            scheduler = create_scheduler(application)
+            scheduler.start()
+            try:
+                await asyncio.Event().wait()
+            finally:
+                scheduler.shutdown(wait=False)
+                lock_file.close()
+        await asyncio.sleep(scheduler_election_interval)
+
+
+async def run_worker(index, update_queue):
+    from telegram import Update
+    from main import build_application, create_scheduler
+    from bot_interactions import flush_summaries, warm_up_models
+
+    application = build_application(updater=False)
+    await application.initialize()
+    #post_init hooks only run with run_polling/run_webhook, so start the warm-up explicitly
+    #Each worker serves its own metrics on the port after the front's (METRICS_PORT + 1 + index)
+    await warm_up_models(application, metrics_port=metrics_port + 1 + index if metrics_port else 0)
+    await application.start()
+    election = asyncio.get_running_loop().create_task(elect_scheduler(application, create_scheduler))
+    logger.info(f"Worker {index} ready")
+
+    loop = asyncio.get_running_loop()
+    #Take an update from the front's queue only when a handler slot is free, so a slow worker's backlog waits in the front
+    slots = asyncio.Semaphore(application.update_processor.max_concurrent_updates)
+    running = set()
+
+    async def process(update):
+        try:
+            await application.process_update(update)
+        finally:
+            slots.release()
+
+    try:
+        while True:
+            await slots.acquire()
+            update_data = await loop.run_in_executor(None, update_queue.get)
+            if update_data is None:
+                break
+            #A malformed update is dropped on its own; it must not stop the worker
+            try:
+                update = Update.de_json(update_data, application.bot)
+            except Exception as e:
+                logger.error(f"Worker {index} dropped update {update_data.get('update_id')} it could not parse: {e!r}")
+                slots.release()
+                continue
+            task = loop.create_task(process(update))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    finally:
+        #Finish every update already taken before shutting down
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        election.cancel()
+        await application.stop()
+        #post_shutdown hooks only run with run_polling/run_webhook, so flush explicitly
+        await flush_summaries(application)
+        await application.shutdown()
+        logger.info(f"Worker {index} stopped")
+
+
+#Entry point of a worker process; heavy modules are only imported here, never in the front process
+def worker_main(index, update_queue):
+    #Workers keep their state on disk so any of them can be restarted without losing conversations
+    os.environ.setdefault('MEMORY_WRITE_THROUGH', '1')
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(run_worker(index, update_queue))
+
+
+#Front process: owns the worker pool and the HTTP endpoint
+#worker_target is called as worker_target(index, update_queue) in each worker process (a stand-in in tests)
+class WebhookFront:
+    def __init__(self, workers, worker_target=None):
+        self.worker_target = worker_target or worker_main
+        self.server = None
+        self.context = multiprocessing.get_context('spawn')
+        self.queues = [self.context.Queue() for _ in range(workers)]
+        self.processes = [None] * workers
+        self.received = 0
+        registry.register_collector('mentaai_webhook', self.stats, label='worker')
+
+    def start_worker(self, index):
+        process = self.context.Process(target=self.worker_target, args=(index, self.queues[index]), name=f"worker-{index}", daemon=True)
+        process.start()
+        self.processes[index] = process
+
+    #Restart any worker that exited unexpectedly
+    async def supervise(self):
+        while True:
+            await asyncio.sleep(supervise_interval)
+            self.restart_dead_workers()
+
+    #A worker killed while waiting in update_queue.get() (e.g. by the OOM killer) leaves the queue's reader lock held forever,
+    #so its replacement gets a new queue; updates still queued for the dead worker are lost with the old one
+    def restart_dead_workers(self):
+        for index, process in enumerate(self.processes):
+            if not process.is_alive():
+                old_queue = self.queues[index]
+                logger.warning(f"Worker {index} exited with code {process.exitcode}, restarting it with a new queue; "
+                               f"updates still queued for it are lost")
+                #Never wait at exit to flush updates into a pipe nobody reads
+                old_queue.cancel_join_thread()
+                old_queue.close()
+                self.queues[index] = self.context.Queue()
+                self.start_worker(index)
+
+    async def handle_update(self, headers, body):
+        if webhook_secret and headers.get('x-telegram-bot-api-secret-token') != webhook_secret:
+            return 403, 'text/plain', b'Forbidden'
+        try:
+            update_data = json.loads(body)
+        except ValueError:
+            return 400, 'text/plain', b'Invalid JSON'
+        if not isinstance(update_data, dict) or not isinstance(update_data.get('update_id'), int):
+            return 400, 'text/plain', b'Invalid update'
+        try:
+            shard = shard_for(update_data, len(self.queues))
+        except (AttributeError, TypeError, ValueError):
+            return 400, 'text/plain', b'Invalid update'
+        self.queues[shard].put(update_data)
+        self.received += 1
+        return 200, 'text/plain', b'OK'
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'workers_alive': sum(process is not None and process.is_alive() for process in self.processes),
+            'queue_depth': {index: update_queue.qsize() for index, update_queue in enumerate(self.queues)},
+        }
+
+    async def handle_health(self, headers, body):
+        alive = sum(process.is_alive() for process in self.processes)
+        payload = json.dumps({'workers': len(self.processes), 'alive': alive, 'received': self.received})
+        return (200 if alive == len(self.processes) else 503), 'application/json', payload.encode('utf-8')
+
+    #Start the workers and the HTTP endpoint
+    async def start(self, host=None, port=None):
+        host = webhook_listen if host is None else host
+        port = webhook_port if port is None else port
+        for index in range(len(self.queues)):
+            self.start_worker(index)
+
+        routes = {('POST', webhook_path): self.handle_update, ('GET', '/healthz'): self.handle_health}
+        self.server = await serve_http(host, port, routes)
+        logger.info(f"Webhook listening on {host}:{port}{webhook_path} with {len(self.queues)} workers")
+
+    #Stop accepting updates, then let every worker drain its queue and shut down cleanly
+    async def stop(self, timeout=30):
+        self.server.close()
+        loop = asyncio.get_running_loop()
+        for update_queue in self.queues:
+            update_queue.put(None)
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, timeout)
+
+    async def run(self):
+        await self.start()
+        #Metrics stay off the public webhook port; the front serves its own on METRICS_PORT
+        await start_metrics()
+
+        if webhook_url:
+            await register_webhook()
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        supervisor = loop.create_task(self.supervise())
+        await stop.wait()
+
+        supervisor.cancel()
+        await self.stop()
+
+
+async def register_webhook():
+    from telegram import Bot, Update
+    async with Bot(os.getenv('TELEGRAM_TOKEN')) as bot:
+        await bot.set_webhook(url=webhook_url.rstrip('/') + webhook_path, secret_token=webhook_secret, allowed_updates=Update.ALL_TYPES)
+    logger.info("Webhook registered with Telegram")
+
+
+def main():
+    asyncio.run(WebhookFront(webhook_workers).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from batching import MicroBatcher
+
+
+#Fails the whole batch if any input is "bad", like a model rejecting one over-long input
+def double_unless_bad(items):
+    if "bad" in items:
+        raise ValueError("input too long")
+    return [item * 2 for item in items]
+
+
+def test_concurrent_inputs_run_as_one_batch():
+    batcher = MicroBatcher('test', double_unless_bad, max_batch_size=8, max_wait_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(text) for text in ("a", "b", "c")))
+
+    assert asyncio.run(scenario()) == ["aa", "bb", "cc"]
+    assert batcher.stats()['batches'] == 1
+    assert batcher.stats()['mean_batch_size'] == 3
+
+
+def test_one_bad_input_only_fails_its_own_caller():
+    batcher = MicroBatcher('test', double_unless_bad, max_batch_size=8, max_wait_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(text) for text in ("a", "bad", "c")), return_exceptions=True)
+
+    good_a, bad, good_c = asyncio.run(scenario())
+    assert (good_a, good_c) == ("aa", "cc")
+    assert isinstance(bad, ValueError)
+    assert batcher.stats()['retried_items'] == 3
+
+
+def test_close_runs_pending_inputs():
+    batcher = MicroBatcher('test', double_unless_bad, max_batch_size=8, max_wait_ms=10000)
+
+    async def scenario():
+        pending = asyncio.ensure_future(batcher.submit("a"))
+        await asyncio.sleep(0)
+        await batcher.close()
+        return await asyncio.wait_for(pending, 1)
+
+    assert asyncio.run(scenario()) == "aa"
+
+
+def test_single_failure_is_raised_to_the_caller():
+    batcher = MicroBatcher('test', double_unless_bad, max_batch_size=1)
+    with pytest.raises(ValueError):
+        asyncio.run(batcher.submit("bad"))
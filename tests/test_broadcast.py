@@ -0,0 +1,33 @@
+import asyncio
+from telegram.error import Forbidden
+from broadcast import Broadcaster
+
+
+class RecordingBot:
+    def __init__(self, blocked=()):
+        self.blocked = set(blocked)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.blocked:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        self.sent.append(chat_id)
+
+
+def test_rerun_of_a_job_only_messages_users_not_yet_handled(tmp_path):
+    db_path = str(tmp_path / 'broadcast.sqlite3')
+    blocked = []
+    bot = RecordingBot(blocked={3})
+
+    stats = asyncio.run(Broadcaster(bot, db_path=db_path, rate=1000, per_chat_interval=0, on_blocked=blocked.append)
+                        .broadcast('job', list(range(120)), "hi"))
+    assert stats['sent'] == 119
+    assert stats['blocked'] == 1
+    assert blocked == [3]
+
+    #Every checkpoint reached the file, so a restarted run resumes without messaging anyone twice
+    bot.sent.clear()
+    stats = asyncio.run(Broadcaster(bot, db_path=db_path, rate=1000, per_chat_interval=0)
+                        .broadcast('job', list(range(125)), "hi"))
+    assert stats['resumed_skipped'] == 120
+    assert sorted(bot.sent) == list(range(120, 125))
@@ -0,0 +1,78 @@
+import pytest
+import crisis_processing
+from crisis_processing import build_crisis_matcher, canonicalize, detect_crisis, match_crisis_keywords
+
+
+#Stand-in for the VADER analyzer: returns a fixed compound score, or fails if sentiment should not be scored
+class FixedSentiment:
+    def __init__(self, compound=None):
+        self.compound = compound
+        self.calls = 0
+
+    def polarity_scores(self, message):
+        self.calls += 1
+        if self.compound is None:
+            raise AssertionError("sentiment should not be scored")
+        return {'compound': self.compound}
+
+
+#Messages with the keyword lists each must fire, covering case, apostrophe and spacing variants
+@pytest.mark.parametrize("message, critical, dangerous", [
+    ("I can't go on like this", ["I can't go on"], []),
+    ("i cant go on", ["I can't go on"], []),
+    ("I CAN’T GO ON", ["I can't go on"], []),
+    ("Some days I wish I was dead", ["wish I was dead"], ["I wish I was dead"]),
+    ("there's no point in living anymore", ["there's no point in living"], ["there's no point"]),
+    ("thinking about self harm again", ["self-harm"], []),
+    ("I'm   overwhelmed and I'm scared", [], ["overwhelmed", "I'm scared"]),
+    ("I'm feeling anxious today, can you help?", [], []),
+    ("My skill myself is improving", [], []),
+])
+def test_keywords_fired_by_a_message(message, critical, dangerous):
+    matches = match_crisis_keywords(message)
+    assert sorted(matches.critical) == sorted(critical)
+    assert sorted(matches.dangerous) == sorted(dangerous)
+
+
+def test_message_without_dangerous_keyword_is_not_scored(monkeypatch):
+    monkeypatch.setattr(crisis_processing, 'analyzer', FixedSentiment())
+    assert detect_crisis("Today was actually a pretty good day") is False
+
+
+def test_critical_keyword_fires_without_scoring(monkeypatch):
+    monkeypatch.setattr(crisis_processing, 'analyzer', FixedSentiment())
+    assert detect_crisis("I can't go on") is True
+
+
+@pytest.mark.parametrize("compound, expected", [(-0.9, True), (-0.65, True), (-0.2, False)])
+def test_dangerous_keyword_fires_below_the_sentiment_threshold(monkeypatch, compound, expected):
+    analyzer = FixedSentiment(compound)
+    monkeypatch.setattr(crisis_processing, 'analyzer', analyzer)
+    assert detect_crisis("I'm overwhelmed") is expected
+    assert analyzer.calls == 1
+
+
+def test_longer_keyword_implies_its_prefixes_only():
+    _, _, implied = build_crisis_matcher(["no point in living"], ["no point", "point"])
+    assert sorted(implied["no point in living"]) == ["no point", "no point in living"]
+    assert implied["no point"] == ["no point"]
+
+
+def test_overlapping_keywords_at_different_positions_all_fire():
+    pattern, categories, implied = build_crisis_matcher(["no point in living"], ["no point", "point", "living"])
+    fired = set()
+    for match in pattern.finditer(canonicalize("There's no point in living")):
+        for form in implied[match.group(1)]:
+            fired.update(keyword for _, keyword in categories[form])
+    assert fired == {"no point in living", "no point", "point", "living"}
+
+
+def test_keyword_in_both_lists_fires_in_both():
+    _, categories, _ = build_crisis_matcher(["I can't go on"], ["i cant go on", "I can't go on"])
+    assert categories["i cant go on"] == [('critical', "I can't go on"), ('dangerous', "i cant go on"), ('dangerous', "I can't go on")]
+
+
+def test_keyword_inside_a_longer_word_does_not_fire():
+    pattern, _, _ = build_crisis_matcher(["kill myself"], [])
+    assert pattern.search(canonicalize("My skill myself is improving")) is None
+    assert pattern.search(canonicalize("I want to kill myself")) is not None
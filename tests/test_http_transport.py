@@ -0,0 +1,78 @@
+import asyncio
+import httpx
+from http_transport import CircuitBreaker, CircuitOpenError, ResilientTransport
+
+
+#Stand-in for the pooled transport: returns the queued status codes in order, or hangs while hang is set
+class ScriptedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.hang = False
+        self.calls = 0
+
+    async def handle_async_request(self, request):
+        self.calls += 1
+        if self.hang:
+            await asyncio.Event().wait()
+        return httpx.Response(self.statuses.pop(0), request=request)
+
+
+def make_transport(scripted, max_retries=0):
+    transport = ResilientTransport(max_retries=max_retries)
+    transport._transport = scripted
+    return transport
+
+
+def test_retries_server_errors_then_returns_the_response(monkeypatch):
+    monkeypatch.setattr('http_transport.retry_delay', lambda attempt, response=None: 0)
+    scripted = ScriptedTransport([503, 502, 200])
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=make_transport(scripted, max_retries=3)) as client:
+            return await client.get('https://api.example.com/v1')
+
+    assert asyncio.run(scenario()).status_code == 200
+    assert scripted.calls == 3
+
+
+def test_cancelled_half_open_trial_does_not_keep_the_circuit_open():
+    scripted = ScriptedTransport([200])
+    transport = make_transport(scripted)
+    #Open the circuit of the host and let its reset time pass, so the next request is the half-open trial
+    transport.breakers['api.example.com'] = breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0)
+    breaker.record_failure()
+    assert breaker.state == 'half_open'
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=transport) as client:
+            scripted.hang = True
+            trial = asyncio.ensure_future(client.get('https://api.example.com/v1'))
+            await asyncio.sleep(0.05)
+            trial.cancel()
+            try:
+                await trial
+            except asyncio.CancelledError:
+                pass
+            scripted.hang = False
+            return await client.get('https://api.example.com/v1')
+
+    assert asyncio.run(scenario()).status_code == 200
+    assert breaker.state == 'closed'
+
+
+def test_open_circuit_fails_fast():
+    scripted = ScriptedTransport()
+    transport = make_transport(scripted)
+    transport.breakers['api.example.com'] = breaker = CircuitBreaker(failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=transport) as client:
+            await client.get('https://api.example.com/v1')
+
+    try:
+        asyncio.run(scenario())
+        raise AssertionError("expected CircuitOpenError")
+    except CircuitOpenError:
+        pass
+    assert scripted.calls == 0
@@ -0,0 +1,69 @@
+import os
+import stat
+from memory_store import UserMemoryManager
+
+
+def test_blocked_flag_from_another_process_keeps_the_owners_newer_record(tmp_path):
+    db_path = str(tmp_path / 'memory.sqlite3')
+    owner = UserMemoryManager(db_path, write_through=True)
+    owner.set_name(1, "Ana")
+    owner.add_turn(1, "hi", "hello")
+    owner.flush()
+
+    #The worker running the check-in marks the user blocked without caching them
+    scheduler = UserMemoryManager(db_path, idle_ttl=0, write_through=True)
+    scheduler.set_blocked(1)
+    scheduler.flush()
+    assert len(scheduler) == 0
+    assert scheduler.named_user_ids() == []
+
+    #The owner keeps talking to the user (who unblocked the bot) and spills its copy
+    owner.add_turn(1, "I'm back", "welcome back")
+    owner.set_summary(1, "Ana returned")
+    owner.set_blocked(1, False)
+    owner.flush()
+
+    scheduler.get(2)
+    scheduler.flush()
+    memory = UserMemoryManager(db_path).get(1)
+    assert memory.recent_turns == (("hi", "hello"), ("I'm back", "welcome back"))
+    assert memory.summary == "Ana returned"
+    assert memory.blocked is False
+    assert scheduler.named_user_ids() == [1]
+
+
+def test_spilling_a_cached_memory_does_not_unblock_the_user(tmp_path):
+    db_path = str(tmp_path / 'memory.sqlite3')
+    owner = UserMemoryManager(db_path, write_through=True)
+    owner.set_name(1, "Ana")
+    owner.flush()
+
+    scheduler = UserMemoryManager(db_path)
+    scheduler.set_blocked(1)
+    scheduler.flush()
+
+    #The owner's copy still says not blocked; writing it back must keep the flag
+    owner.set_summary(1, "summary")
+    owner.flush()
+    assert scheduler.named_user_ids() == []
+    assert UserMemoryManager(db_path).get(1).blocked is True
+
+
+def test_blocked_users_are_skipped_until_they_write_again(tmp_path):
+    manager = UserMemoryManager(str(tmp_path / 'memory.sqlite3'))
+    for user_id in (1, 2, 3):
+        manager.set_name(user_id, "name")
+    manager.set_blocked(2)
+    assert sorted(manager.named_user_ids()) == [1, 3]
+
+    manager.set_blocked(2, False)
+    assert sorted(manager.named_user_ids()) == [1, 2, 3]
+
+
+def test_database_file_is_private(tmp_path):
+    db_path = str(tmp_path / 'memory.sqlite3')
+    manager = UserMemoryManager(db_path, write_through=True)
+    manager.set_name(1, "Ana")
+    manager.flush()
+    for name in os.listdir(tmp_path):
+        assert stat.S_IMODE(os.stat(tmp_path / name).st_mode) == 0o600
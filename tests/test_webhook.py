@@ -0,0 +1,144 @@
+import os
+import json
+import signal
+import asyncio
+import functools
+import multiprocessing
+import urllib.request
+from urllib.error import HTTPError
+import webhook
+from webhook import WebhookFront, extract_user_id, shard_for
+
+
+#Stand-in for worker_main: records which worker received each update instead of running the bot
+def recording_worker(results, index, update_queue):
+    while True:
+        update_data = update_queue.get()
+        if update_data is None:
+            break
+        results.put((index, update_data.get('update_id'), extract_user_id(update_data)))
+    results.put((index, None, None))
+
+
+def make_update(update_id, user_id, text="hello"):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': 0, 'text': text,
+            'from': {'id': user_id, 'is_bot': False, 'first_name': "Test"},
+            'chat': {'id': user_id, 'type': 'private'},
+        },
+    }
+
+
+def post(port, body, headers=None):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{webhook.webhook_path}", data=body, headers=headers or {}, method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except HTTPError as e:
+        return e.code
+
+
+#Start a front with recording workers, post the bodies over HTTP one by one, stop it and return
+#the HTTP statuses, the (worker, update_id, user_id) records in arrival order and the front itself
+def run_front(workers, bodies, headers=None):
+    results = multiprocessing.get_context('spawn').Queue()
+    front = WebhookFront(workers, worker_target=functools.partial(recording_worker, results))
+
+    async def scenario():
+        await front.start('127.0.0.1', 0)
+        port = front.server.sockets[0].getsockname()[1]
+        loop = asyncio.get_running_loop()
+        statuses = []
+        for body in bodies:
+            statuses.append(await loop.run_in_executor(None, post, port, body, headers))
+        await front.stop(timeout=30)
+        return statuses
+
+    statuses = asyncio.run(scenario())
+    records = []
+    stopped = 0
+    while stopped < workers:
+        record = results.get(timeout=30)
+        if record[1] is None:
+            stopped += 1
+        else:
+            records.append(record)
+    return statuses, records, front
+
+
+def test_updates_reach_the_worker_of_their_user_in_order():
+    workers = 3
+    user_ids = [101, 102, 103, 104, 105, 106, 107]
+    updates = [make_update(i, user_ids[i % len(user_ids)], f"message {i}") for i in range(35)]
+
+    statuses, records, front = run_front(workers, [json.dumps(update).encode('utf-8') for update in updates])
+
+    assert statuses == [200] * len(updates)
+    assert front.received == len(updates)
+    assert sorted(update_id for _, update_id, _ in records) == [update['update_id'] for update in updates]
+    for index, update_id, user_id in records:
+        assert index == shard_for(updates[update_id], workers)
+    #Every user's updates arrive in the order they were posted
+    for user_id in user_ids:
+        received = [update_id for _, update_id, record_user_id in records if record_user_id == user_id]
+        assert received == sorted(received)
+    #Seven users over three workers: every worker gets some of them
+    assert {index for index, _, _ in records} == set(range(workers))
+
+
+def test_rejected_updates_are_not_forwarded(monkeypatch):
+    monkeypatch.setattr(webhook, 'webhook_secret', 'secret')
+    valid = json.dumps(make_update(1, 42)).encode('utf-8')
+
+    statuses, records, _ = run_front(1, [valid])
+    assert statuses == [403]
+    assert records == []
+
+    headers = {'X-Telegram-Bot-Api-Secret-Token': 'secret'}
+    malformed = [b'not json', b'[1, 2]', b'{"message": {"text": "x"}}', b'{"update_id": "1"}',
+                 b'{"update_id": 2, "message": {"from": "x", "chat": {"id": "abc"}}}']
+    statuses, records, _ = run_front(1, malformed + [valid], headers)
+    assert statuses == [400] * len(malformed) + [200]
+    assert records == [(0, 1, 42)]
+
+
+#A SIGKILLed worker can die holding its queue's reader lock, so its replacement must get a new queue
+def test_replacement_of_a_killed_worker_receives_new_updates():
+    results = multiprocessing.get_context('spawn').Queue()
+    front = WebhookFront(1, worker_target=functools.partial(recording_worker, results))
+
+    async def scenario():
+        await front.start('127.0.0.1', 0)
+        port = front.server.sockets[0].getsockname()[1]
+        loop = asyncio.get_running_loop()
+        assert await loop.run_in_executor(None, post, port, json.dumps(make_update(1, 42)).encode('utf-8')) == 200
+        #Once the first update is recorded the worker is back waiting in update_queue.get()
+        assert await loop.run_in_executor(None, functools.partial(results.get, timeout=30)) == (0, 1, 42)
+        #Let the worker's feeder thread release the results queue's write lock, which the kill would otherwise leave held
+        await asyncio.sleep(0.5)
+        killed = front.processes[0]
+        os.kill(killed.pid, signal.SIGKILL)
+        await loop.run_in_executor(None, killed.join, 30)
+
+        front.restart_dead_workers()
+        assert front.processes[0] is not killed
+        assert await loop.run_in_executor(None, post, port, json.dumps(make_update(2, 42)).encode('utf-8')) == 200
+        assert await loop.run_in_executor(None, functools.partial(results.get, timeout=30)) == (0, 2, 42)
+        await front.stop(timeout=30)
+
+    asyncio.run(scenario())
+
+
+def test_shard_for_uses_the_sender_then_the_chat_then_the_update_id():
+    callback = {'update_id': 7, 'callback_query': {'id': 'q', 'from': {'id': 11}, 'message': {'chat': {'id': 99}}}}
+    channel_post = {'update_id': 8, 'my_chat_member': {'chat': {'id': -100200}}}
+    unknown = {'update_id': 9, 'poll': {'id': 'p'}}
+
+    assert extract_user_id(callback) == 11
+    assert extract_user_id(channel_post) == -100200
+    assert extract_user_id(unknown) is None
+    assert shard_for(callback, 4) == 11 % 4
+    assert shard_for(channel_post, 4) == 100200 % 4
+    assert shard_for(unknown, 4) == 9 % 4